@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+# allow running from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_ranking.core import get_group_ranks
+from image_ranking.image_blur import calculate_sml, calculate_sobel, calculate_laplacian, rank_blur_progressive
+
+
+def get_ranks(scores: list, max_rank: int) -> list:
+    # ranks by frame for a group, as apply_group_ratings sets them
+    order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    ranks = [0] * len(scores)
+    for i, rank in zip(order, get_group_ranks(len(scores), max_rank)):
+        ranks[i] = rank
+    return ranks
+
+
+# progressive tile sampled blur ranking vs the full crop, pixels processed and rank agreement
+def main():
+
+    bursts = 24
+    frames = 7
+    max_rank = 3
+    size = (1000, 750)
+    rng = np.random.default_rng(0)
+
+    # bursts of one scene as cropped grayscale blur images, frames with close and distant blur
+    groups = []
+    for burst in range(bursts):
+        small = rng.integers(0, 256, (size[1] // 12, size[0] // 12), dtype=np.uint8)
+        scene = cv2.GaussianBlur(cv2.resize(small, size, interpolation=cv2.INTER_NEAREST), (0, 0), 1.5)
+        sigmas = rng.uniform(0.4, 2.5, frames)
+        if burst % 2:
+            sigmas = 1.0 + rng.uniform(0, 0.08, frames)
+        images = []
+        for frame, sigma in enumerate(sigmas):
+            image = cv2.GaussianBlur(np.roll(scene, frame * 3, axis=1), (0, 0), sigma)
+            noise = rng.normal(0, 2, image.shape)
+            images.append(np.clip(image + noise, 0, 255).astype(np.uint8))
+        groups.append(images)
+
+    print(f"{'mode':>10} {'tolerance':>10} {'pixels %':>9} {'speedup':>8} {'frames same':>12} "
+          f"{'groups same':>12} {'early':>6}")
+    full_modes = {"sml": calculate_sml, "sobel": calculate_sobel, "laplacian": calculate_laplacian}
+    for mode, calculate in full_modes.items():
+
+        # full crop reference
+        start = time.perf_counter()
+        reference = [get_ranks([calculate(image) for image in images], max_rank) for images in groups]
+        full_seconds = time.perf_counter() - start
+
+        for tolerance in (0.01, 0.05, 0.2):
+            pixels, total, early, same_frames, same_groups = 0, 0, 0, 0, 0
+            start = time.perf_counter()
+            for images, expected in zip(groups, reference):
+                scores, scored, counts = rank_blur_progressive(
+                    images, get_group_ranks(len(images), max_rank), mode, tolerance)
+                ranks = get_ranks(scores, max_rank)
+                pixels += sum(scored)
+                total += sum(counts)
+                early += sum(1 for done, count in zip(scored, counts) if done < count)
+                same_frames += sum(1 for a, b in zip(ranks, expected) if a == b)
+                same_groups += int(ranks == expected)
+            seconds = time.perf_counter() - start
+
+            print(f"{mode:>10} {tolerance:>10} {pixels / total * 100:>9.1f} {full_seconds / seconds:>8.2f} "
+                  f"{same_frames:>6}/{bursts * frames} {same_groups:>7}/{bursts} {early:>6}")
+
+
+if __name__ == '__main__':
+    main()
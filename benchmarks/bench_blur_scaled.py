@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import tempfile
+import cv2
+import numpy as np
+
+# allow running from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_ranking.image_blur import calculate_blur
+
+
+def spearman(a: list, b: list) -> float:
+    # rank correlation, no ties in continuous scores
+    ra = np.argsort(np.argsort(a)).astype(float)
+    rb = np.argsort(np.argsort(b)).astype(float)
+    ra -= ra.mean()
+    rb -= rb.mean()
+    return float((ra * rb).sum() / np.sqrt((ra ** 2).sum() * (rb ** 2).sum()))
+
+
+def get_agreement(scores: list, reference: list) -> tuple:
+    # mean and min rank correlation per burst, bursts with the same sharpest frame
+    correlations = [spearman(a, b) for a, b in zip(scores, reference)]
+    top = sum(int(np.argmax(a) == np.argmax(b)) for a, b in zip(scores, reference))
+    return np.mean(correlations), min(correlations), top
+
+
+# scaled JPEG decode vs full decode and resize, throughput and rank agreement
+def main():
+
+    bursts = 8
+    frames = 6
+    size = (4000, 3000)
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        # bursts of one scene, each frame with a different blur and a little shift, sharper frames rank higher
+        groups, truth = [], []
+        for burst in range(bursts):
+            small = rng.integers(0, 256, (size[1] // 16, size[0] // 16, 3), dtype=np.uint8)
+            scene = cv2.GaussianBlur(cv2.resize(small, size, interpolation=cv2.INTER_NEAREST), (0, 0), 1.5)
+            sigmas = rng.uniform(0.3, 3.0, frames)
+            paths = []
+            for frame, sigma in enumerate(sigmas):
+                image = cv2.GaussianBlur(np.roll(scene, frame * 2, axis=1), (0, 0), sigma)
+                path = os.path.join(directory, f"burst{burst}_{frame}.jpg")
+                cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+                paths.append(path)
+            groups.append(paths)
+            truth.append(list(-sigmas))
+
+        print(f"{'mode':>10} {'resize':>8} {'decode':>7} {'images/s':>9} {'speedup':>8} "
+              f"{'vs full':>8} {'min':>6} {'same top':>9} {'vs truth':>9} {'same top':>9}")
+        count = bursts * frames
+        for mode in ("sml", "sobel", "laplacian"):
+            for resize in (("half", "half"), ("quarter", "quarter")):
+                results = {}
+                for scaled in (False, True):
+                    start = time.perf_counter()
+                    scores = [[calculate_blur(path, "image/jpeg", mode, resize, 30, None, None, scaled)
+                               for path in paths] for paths in groups]
+                    results[scaled] = (scores, time.perf_counter() - start)
+
+                full_scores, full_seconds = results[False]
+                for scaled, (scores, seconds) in results.items():
+                    correlation, minimum, top = get_agreement(scores, full_scores)
+                    truth_correlation, truth_minimum, truth_top = get_agreement(scores, truth)
+                    print(f"{mode:>10} {resize[0]:>8} {'scaled' if scaled else 'full':>7} {count / seconds:>9.1f} "
+                          f"{full_seconds / seconds:>8.2f} {correlation:>8.3f} {minimum:>6.3f} "
+                          f"{top:>5}/{bursts} {truth_correlation:>9.3f} {truth_top:>5}/{bursts}")
+
+
+if __name__ == '__main__':
+    main()
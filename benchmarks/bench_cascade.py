@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+# allow running from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_ranking.config import RankingConfig
+from image_ranking.image_group import ImageGrouper
+from image_ranking.image_hash import ImageHash
+from image_ranking.stats import stats_get, stats_reset
+
+
+def create_bursts(rng, bursts: int, frames: int) -> list:
+    # bursts of one scene with a moving subject, consecutive bursts are different scenes
+    images = []
+    for _ in range(bursts):
+        small = rng.integers(0, 256, (40, 60, 3), dtype=np.uint8)
+        scene = cv2.GaussianBlur(cv2.resize(small, (1200, 800), interpolation=cv2.INTER_NEAREST), (0, 0), 2)
+        step = rng.integers(0, 40)
+        for frame in range(frames):
+            image = scene.copy()
+            center = (200 + frame * step, 400)
+            cv2.circle(image, center, 60 + rng.integers(0, 60), (255, 255, 255), -1)
+            noise = rng.normal(0, 3, image.shape)
+            images.append(np.clip(image + noise, 0, 255).astype(np.uint8))
+    return images
+
+
+def get_groups(images: list, config: RankingConfig) -> tuple:
+    # group in sequence, group index by image, full compares and grouping seconds
+    hashes = []
+    for i, data in enumerate(images):
+        image = ImageHash(f"IMG_{i:04d}", config, data)
+        image.initialize()
+        hashes.append(image)
+
+    stats_reset()
+    grouper = ImageGrouper()
+    groups, index = [], -1
+    start = time.perf_counter()
+    for image in hashes:
+        if grouper.add(image):
+            index += 1
+        groups.append(index)
+    return groups, stats_get("compare_full"), time.perf_counter() - start
+
+
+# grouping and full compares with the coarse-to-fine cascade vs without it
+def main():
+
+    rng = np.random.default_rng(0)
+    images = create_bursts(rng, 12, 6)
+
+    reference, compares, seconds = get_groups(images, RankingConfig())
+
+    print(f"{len(images)} images, {reference[-1] + 1} groups")
+    print(f"{'band':>12} {'full compares':>14} {'ms':>8} {'same groups':>12}")
+    print(f"{'off':>12} {compares:>14} {seconds * 1000:>8.1f} {'yes':>12}")
+    for band in ((0.25, 2.0), (0.5, 1.5), (0.75, 1.25)):
+        groups, compares, seconds = get_groups(images, RankingConfig(cascade_band=band))
+        print(f"{f'{band[0]} {band[1]}':>12} {compares:>14} {seconds * 1000:>8.1f} "
+              f"{'yes' if groups == reference else 'no':>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import io
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import cv2
+
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+# allow running from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_ranking.config import RankingConfig
+from image_ranking.content_type import get_buffer_mime_type
+from image_ranking.cv2_image_hash import cv2_compare_image
+from image_ranking.darktable_set_rating import darktable_set_rating
+from image_ranking.free_threading import is_free_threaded_build, is_gil_enabled
+from image_ranking.image_exif import get_exif
+
+
+# jpeg bytes with an exif block
+def create_jpeg(rng) -> bytes:
+    image = Image.fromarray(rng.integers(0, 256, (120, 160, 3), dtype=np.uint8))
+    exif = image.getexif()
+    exif[0x010F] = "FUJIFILM"
+    exif[0x0110] = "X-T5"
+    exif[0x0112] = 1
+    ifd = exif.get_ifd(0x8769)
+    ifd[0x9003] = "2025:01:13 19:19:16"
+    ifd[0x9291] = "123"
+    ifd[0xA002] = 160
+    ifd[0xA003] = 120
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+# pure python stages on worker threads, items per second by thread count
+def main():
+
+    items = 400
+    rng = np.random.default_rng(0)
+    jpegs = [create_jpeg(rng) for _ in range(16)]
+    config = RankingConfig()
+
+    # similarity image pairs with many small differences, contour loop in python
+    pairs = []
+    for _ in range(16):
+        a = rng.integers(0, 256, (196, 144), dtype=np.uint8)
+        b = a.copy()
+        b[rng.random(a.shape) < 0.02] = 0
+        pairs.append((a, b))
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        # existing xmp files, every task edits its own
+        paths = [os.path.join(directory, f"IMG_{i:04d}.jpg.xmp") for i in range(items)]
+        for i, path in enumerate(paths):
+            darktable_set_rating(path, os.path.basename(path)[:-4], 1, True)
+
+        workloads = {
+            "exif": lambda i: get_exif(None, jpegs[i % len(jpegs)]),
+            "sniff": lambda i: [get_buffer_mime_type(jpegs[(i + j) % len(jpegs)]) for j in range(200)],
+            "xmp": lambda i: darktable_set_rating(paths[i], os.path.basename(paths[i])[:-4], 1 + i % 5, True),
+            "compare": lambda i: cv2_compare_image(*pairs[i % len(pairs)], config),
+        }
+
+        print(f"python {sys.version.split()[0]}, free-threaded build: {is_free_threaded_build()}, "
+              f"GIL enabled: {is_gil_enabled()}, {os.cpu_count()} cpus")
+        thread_counts = [count for count in (1, 2, 4, 8, 16) if count <= max(2, (os.cpu_count() or 1) * 2)]
+        print(f"{'stage':>8} " + " ".join(f"{f'{count}t items/s':>14}" for count in thread_counts)
+              + f" {'speedup':>8}")
+
+        cv2.setNumThreads(1)
+        for name, workload in workloads.items():
+            rates = []
+            for count in thread_counts:
+                with ThreadPoolExecutor(max_workers=count) as executor:
+                    start = time.perf_counter()
+                    list(executor.map(workload, range(items)))
+                    rates.append(items / (time.perf_counter() - start))
+            print(f"{name:>8} " + " ".join(f"{rate:>14.1f}" for rate in rates)
+                  + f" {max(rates) / rates[0]:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import io
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+# allow running from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_ranking.cv2_image_hash import cv2_get_image, cv2_resize
+
+
+# previous heic path: full decode, copy through PIL, grayscale, then resize
+def get_image_full(data: bytes, resize: tuple):
+    from PIL import Image
+    import pillow_heif
+
+    image = pillow_heif.read_heif(io.BytesIO(data))
+    image = Image.frombytes(image.mode, image.size, image.data, "raw")
+    image = np.array(image)
+    image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return cv2_resize(image, resize)
+
+
+# heic decode time and agreement, full decode vs reduced size decode
+def main():
+    import pillow_heif
+    from PIL import Image
+
+    repeat = 5
+    rng = np.random.default_rng(0)
+
+    # smooth synthetic scene, noise would not survive encoding
+    size = (4032, 3024)
+    small = rng.integers(0, 256, (size[1] // 64, size[0] // 64, 3), dtype=np.uint8)
+    scene = cv2.resize(small, size, interpolation=cv2.INTER_CUBIC)
+
+    print(f"{'thumbnails':>12} {'resize':>20} {'full ms':>9} {'reduced ms':>11} {'mean abs diff':>14}")
+    for thumbnails in ([], [1024]):
+        heif = pillow_heif.from_pillow(Image.fromarray(scene))
+        f = io.BytesIO()
+        heif.save(f, quality=90, thumbnails=thumbnails)
+        data = f.getvalue()
+
+        for resize in ((196, 144), ('quarter', 'quarter'), ('half', 'half')):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                full = get_image_full(data, resize)
+            full_ms = (time.perf_counter() - start) / repeat * 1000
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                reduced = cv2_get_image('memory.heic', 'image/heic', True, data, resize)
+            reduced_ms = (time.perf_counter() - start) / repeat * 1000
+
+            diff = np.abs(full.astype(np.int16) - reduced.astype(np.int16)).mean()
+            print(f"{str(thumbnails):>12} {str(resize):>20} {full_ms:>9.1f} {reduced_ms:>11.1f} {diff:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
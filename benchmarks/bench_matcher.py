@@ -0,0 +1,37 @@
+import os
+import sys
+import time
+import numpy as np
+
+# allow running from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_ranking.image_matcher import MATCHERS, match_count
+
+
+# pair matching time vs keypoint count for each matcher backend
+def main():
+
+    repeat = 5
+    rng = np.random.default_rng(0)
+
+    print(f"{'keypoints':>10} {'matcher':>12} {'needed':>8} {'matches':>8} {'early':>6} {'ms/pair':>9}")
+    for keypoints in (125, 250, 500, 1000, 2000):
+
+        # random ORB-like descriptors, half of the second set are noisy copies of the first
+        des1 = rng.integers(0, 256, (keypoints, 32), dtype=np.uint8)
+        des2 = rng.integers(0, 256, (keypoints, 32), dtype=np.uint8)
+        noise = rng.integers(0, 2, (keypoints // 2, 32), dtype=np.uint8)
+        des2[:keypoints // 2] = des1[:keypoints // 2] ^ noise
+
+        for matcher in MATCHERS:
+            for needed in (None, round(keypoints * 0.4)):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    count, early = match_count(des1, des2, matcher, needed)
+                elapsed = (time.perf_counter() - start) / repeat * 1000
+                print(f"{keypoints:>10} {matcher:>12} {str(needed):>8} {count:>8} {str(early):>6} {elapsed:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
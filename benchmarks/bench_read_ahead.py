@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import hashlib
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+# allow running from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_ranking.read_ahead import ReadAhead, read_file
+from image_ranking.stats import stats_get, stats_reset
+
+
+# throttled filesystem stand-in, fixed latency plus bandwidth limit per read
+def throttled_reader(latency: float = 0.02, mb_per_s: float = 100):
+    def reader(path: str) -> bytes:
+        data = read_file(path)
+        time.sleep(latency + len(data) / (mb_per_s * 1024 ** 2))
+        return data
+    return reader
+
+
+# cpu bound stand-in for decode
+def decode(path: str, data: bytes):
+    for _ in range(8):
+        data = hashlib.sha256(data).digest() + data[32:]
+    return len(data)
+
+
+# read-ahead stage vs mixed read/decode pool on a throttled filesystem
+def main():
+
+    files = 48
+    size = 4 * 1024 ** 2
+    threads = os.cpu_count() or 4
+    reader = throttled_reader()
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        # create test files
+        paths = []
+        for i in range(files):
+            path = os.path.join(directory, f"{i:04d}.bin")
+            with open(path, 'wb') as f:
+                f.write(os.urandom(size))
+            paths.append(path)
+
+        total = files * size / 1024 ** 2
+        print(f"{files} files, {total:.0f} MB, decode threads {threads}")
+
+        # mixed pool, each worker reads then decodes
+        for workers in (threads // 2 or 1, threads, threads * 4):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(lambda path: decode(path, reader(path)), paths))
+            elapsed = time.perf_counter() - start
+            print(f"mixed pool    workers {workers:>3}: {total / elapsed:8.1f} MB/s")
+
+        # read-ahead, io pool feeds cpu sized decode pool
+        for io_threads in (4, 8, 16):
+            for budget in (32, 128):
+                stats_reset()
+                read_ahead = ReadAhead(io_threads, threads, budget * 1024 ** 2, reader)
+                read_ahead.map(decode, paths, lambda path: path, "bench")
+                print(f"read-ahead io {io_threads:>3} budget {budget:>4}M: "
+                      f"{stats_get('bench_mb_per_s'):8.1f} MB/s, "
+                      f"cpu {stats_get('bench_cpu_utilisation') * 100:5.1f}%")
+
+
+if __name__ == '__main__':
+    main()
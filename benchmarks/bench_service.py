@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import subprocess
+import numpy as np
+import cv2
+
+# allow running from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from image_ranking.service import RankingService, serve
+from image_ranking.client import submit_job, wait_job
+
+
+# synthetic shoot, bursts of shifted frames
+def create_images(directory: str, scenes: int = 10, burst: int = 4):
+    rng = np.random.default_rng(0)
+    for scene in range(scenes):
+        base = cv2.GaussianBlur(rng.integers(0, 256, (1200, 1600, 3), dtype=np.uint8), (0, 0), 8)
+        base = cv2.normalize(base, None, 0, 255, cv2.NORM_MINMAX)
+        for frame in range(burst):
+            cv2.imwrite(os.path.join(directory, f"IMG_{scene:03d}{frame}.jpg"), np.roll(base, frame * 4, axis=1))
+
+
+# per job latency, cold process per job vs warm service
+def main():
+
+    with tempfile.TemporaryDirectory() as directory:
+        create_images(directory)
+
+        # cold, new process per job
+        for run in range(2):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(ROOT, 'image-ranking.py'), directory],
+                           check=True, capture_output=True)
+            print(f"cold process      run {run + 1}: {time.perf_counter() - start:6.2f} s")
+
+        # warm service, first job fills the cache
+        service = RankingService(os.cpu_count() or 4)
+        server = serve(service, '127.0.0.1', 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        for run in range(3):
+            start = time.perf_counter()
+            job = submit_job(url, {'directory': directory})
+            wait_job(url, job['id'], interval=0.01)
+            print(f"warm service      run {run + 1}: {time.perf_counter() - start:6.2f} s")
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,157 +1,359 @@
-
-import time
-import argparse
-import logging
-import os
-
-from logging.handlers import MemoryHandler
-
-from pathlib import Path
-
-from image_ranking.core import Core
-
-# create formatter
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(
-    logging.Formatter('%(asctime)s [%(levelname)s] %(message)s',
-                      datefmt='%H:%M:%S'))
-
-# create memory buffer
-buffer_handler = MemoryHandler(
-    capacity=10000,
-    flushLevel=logging.INFO,
-    target=console_handler
-)
-
-# setup logging
-logging.basicConfig(
-    handlers=[buffer_handler],
-    level=logging.INFO  # Default level
-)
-
-
-# main process
-def main(args: argparse.Namespace):
-
-    # get image directory
-    directory = args.directory
-    if not os.path.isabs(directory):
-        directory = Path(__file__).resolve().parent / directory
-    if not os.path.isdir(directory):
-        logging.error(f"directory: {directory} is not a valid directory")
-        exit(1)
-    args.directory = directory
-    logging.info(f"directory: {directory}")
-
-    # initialize Ranking class
-    core = Core(args)
-
-    # get and hash images
-    start_time = time.time()
-    core.get_and_hash_images()
-    end_time = time.time()
-    logging.debug(f"get_and_hash_images executed in {end_time - start_time:.2f} seconds")
-
-    # group images
-    start_time = time.time()
-    core.group()
-    end_time = time.time()
-    logging.debug(f"group executed in {end_time - start_time:.2f} seconds")
-
-    # calculate blur for each image
-    start_time = time.time()
-    core.calculate_blur()
-    end_time = time.time()
-    logging.debug(f"calculate_blur executed in {end_time - start_time:.2f} seconds")
-
-    # process groups
-    start_time = time.time()
-    core.apply_ratings()
-    end_time = time.time()
-    logging.debug(f"apply_ratings executed in {end_time - start_time:.2f} seconds")
-
-
-# main entry point
-if __name__ == '__main__':
-
-    # init
-    start_time = time.time()
-    default_threads = os.cpu_count() if os.cpu_count() else 4
-
-    # parse command line arguments
-    parser = argparse.ArgumentParser(description='run blur detection on a single image')
-
-    parser.add_argument('directory', type=str, help='directory of images')
-
-    parser.add_argument('-f', '--feature_matching', action='store_true',
-                        help='feature matching mode')
-    parser.add_argument('-e', '--exclude', action='store_true',
-                        help='exclude files with existing xmp')
-
-    parser.add_argument('-d', '--diff', metavar='float', type=float, default=0,
-                        help='image difference threshold')
-
-    parser.add_argument('-m', '--max_rank', metavar='int', type=int, default=3,
-                        help='max image rank (1 to 5)')
-    parser.add_argument('-t', '--threads', metavar='int', type=int, default=default_threads,
-                        help='number of threads')
-    parser.add_argument('-l', '--limit', metavar='int', type=int, default=250,
-                        help='max number of images to process')
-
-    parser.add_argument('--similarity_resize', metavar='(width, height)', type=tuple, default=None,
-                        help='similarity detection image size, supports keywords "half/third/quarter"')
-    parser.add_argument('--similarity_crop', metavar='int', default=15,
-                        help='similarity detection crop mask (in %)')
-    parser.add_argument('--similarity_blur', metavar='[5]', type=str, nargs='+', default=[5],
-                        help='List of radii for Gaussian blur applied before similarity detection')
-    parser.add_argument('--similarity_min_contour', metavar='int', type=int, default=500,
-                        help='Similarity minimum contour area')
-    parser.add_argument('--similarity_delta', metavar='int', type=int, default=25,
-                        help='Similarity delta threshold')
-
-    parser.add_argument('--blur_mode', metavar='str', default='sum_modified_laplacian',
-                        help='blur detection algorithm (sum_modified_laplacian, sobel, laplacian)')
-    parser.add_argument('--blur_crop', metavar='int', default=30,
-                        help='blur detection crop mask (in %)')
-    parser.add_argument('--blur_resize', metavar='(width, height)', type=tuple, default=None,
-                        help='blur detection image size, supports keywords "half/third/quarter"')
-
-    parser.add_argument('-v', '--verbose', action='store_true', help='set logging level to debug')
-
-    # show help if no args
-    import sys
-    if len(sys.argv) == 1:
-        parser.print_help(sys.stderr)
-        exit(1)
-
-    # parse args
-    args = parser.parse_args();
-
-    # debug
-    if args.verbose:
-        logging.getLogger().setLevel(logging.DEBUG)
-
-    # conditional defaults
-    if args.diff <= 0:
-        if args.feature_matching:
-            args.diff = 0.4
-        else:
-            args.diff = 0.6
-    if args.similarity_resize is None:
-        if args.feature_matching:
-            args.similarity_resize = ('quarter', 'quarter')
-        else:
-            args.similarity_resize = (144, 196)
-    if args.blur_resize is None:
-       args.blur_resize = ('half', 'half')
-
-    # run main process
-    try:
-        main(args)
-
-    except KeyboardInterrupt:
-        logging.warning("process interrupted by user")
-
-    # end
-    end_time = time.time()
-    logging.info(f"execution time {end_time - start_time:.2f} seconds")
+
+import time
+import argparse
+import logging
+import os
+
+from contextlib import nullcontext
+from logging.handlers import MemoryHandler
+
+from pathlib import Path
+
+from image_ranking.core import Core
+from image_ranking.config import apply_defaults
+from image_ranking.stats import stats_log
+from image_ranking.decode_memory import set_decode_memory, report_decode_memory
+from image_ranking.free_threading import log_gil_status
+from image_ranking.image_matcher import MATCHERS
+
+# create formatter
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(
+    logging.Formatter('%(asctime)s [%(levelname)s] %(message)s',
+                      datefmt='%H:%M:%S'))
+
+# create memory buffer
+buffer_handler = MemoryHandler(
+    capacity=10000,
+    flushLevel=logging.INFO,
+    target=console_handler
+)
+
+# setup logging
+logging.basicConfig(
+    handlers=[buffer_handler],
+    level=logging.INFO  # Default level
+)
+
+
+# parse size argument, supports K/M/G suffixes
+def parse_size(value: str) -> int:
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    value = str(value).strip().lower().rstrip('b')
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+# run ranking service until interrupted
+def run_service(args: argparse.Namespace):
+    from image_ranking.service import RankingService, serve
+
+    service = RankingService(args.threads)
+    server = serve(service, args.host, args.port)
+    logging.info(f"serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+# submit directory to a running service and wait for it
+def submit(args: argparse.Namespace):
+    from image_ranking.client import submit_job, wait_job
+
+    options = {k: v for k, v in vars(args).items()
+               if k not in ('serve', 'host', 'port', 'server', 'priority', 'sweep', 'ground_truth', 'journal', 'resume', 'batch', 'profile', 'max_decode_memory',
+                         'verbose')}
+    job = submit_job(args.server, options, args.priority)
+    logging.info(f"job {job['id']} submitted to {args.server}")
+
+    # log stage changes
+    stage = None
+    def progress(status: dict):
+        nonlocal stage
+        if status['stage'] != stage:
+            stage = status['stage']
+            logging.info(f"job {status['id']}: {stage} ({status['progress'] * 100:.0f}%)")
+
+    status = wait_job(args.server, job['id'], callback=progress)
+    if status['error']:
+        logging.error(f"job {status['id']} failed: {status['error']}")
+        exit(1)
+    logging.info(f"job {status['id']} done: {status['images']} images, {status['groups']} groups "
+                 f"in {status['run_seconds']:.2f} seconds")
+
+
+# main process
+def main(args: argparse.Namespace):
+
+    # limit the memory of concurrent decodes
+    if args.max_decode_memory > 0:
+        set_decode_memory(args.max_decode_memory)
+
+    # run ranking service
+    if args.serve:
+        run_service(args)
+        return
+
+    # rank many directories in one process
+    if args.batch:
+        from image_ranking.batch import run_batch
+        run_batch(args, Path(__file__).resolve().parent)
+        report_decode_memory()
+        stats_log()
+        return
+
+    # get image directory
+    if args.directory is None:
+        logging.error("directory is required")
+        exit(1)
+    directory = args.directory
+    if not os.path.isabs(directory):
+        directory = Path(__file__).resolve().parent / directory
+    if not os.path.isdir(directory):
+        logging.error(f"directory: {directory} is not a valid directory")
+        exit(1)
+    args.directory = str(directory)
+    logging.info(f"directory: {directory}")
+
+    # calibrate grouping options on a labeled shoot
+    if args.sweep:
+        if args.ground_truth is None:
+            logging.error("--sweep requires --ground_truth")
+            exit(1)
+        from image_ranking.image_sweep import run_sweep
+        run_sweep(args)
+        stats_log()
+        return
+
+    # submit to ranking service
+    if args.server:
+        submit(args)
+        return
+
+    # sample all threads per stage
+    profiler = None
+    if args.profile:
+        from image_ranking.profiler import StageProfiler
+        profiler = StageProfiler()
+
+    def stage(name: str):
+        return profiler.stage(name) if profiler else nullcontext()
+
+    # sharded run, hash, group and blur on worker processes
+    if args.shards > 0:
+        if args.shard_dir is None:
+            args.shard_dir = os.path.join(directory, '.shards')
+
+        start_time = time.time()
+        from image_ranking.shard import run_sharded
+        with stage("run_sharded"):
+            core = run_sharded(args, profiler)
+        end_time = time.time()
+        logging.debug(f"run_sharded executed in {end_time - start_time:.2f} seconds")
+
+        # single shard of a multi node run, ratings are applied on merge
+        if args.shard_index is not None:
+            stats_log()
+            return
+
+    else:
+
+        # initialize Ranking class, journal the run so it can be resumed
+        journal = None
+        if args.journal:
+            from image_ranking.journal import RunJournal
+            journal = RunJournal(args, args.resume)
+        core = Core(args, journal=journal)
+
+        # get and hash images
+        start_time = time.time()
+        with stage("get_and_hash_images"):
+            core.get_and_hash_images()
+        end_time = time.time()
+        logging.debug(f"get_and_hash_images executed in {end_time - start_time:.2f} seconds")
+
+        # group images
+        start_time = time.time()
+        with stage("group"):
+            core.group()
+        end_time = time.time()
+        logging.debug(f"group executed in {end_time - start_time:.2f} seconds")
+
+        # calculate blur for each image
+        start_time = time.time()
+        with stage("calculate_blur"):
+            core.calculate_blur()
+        end_time = time.time()
+        logging.debug(f"calculate_blur executed in {end_time - start_time:.2f} seconds")
+
+    # process groups
+    start_time = time.time()
+    with stage("apply_ratings"):
+        core.apply_ratings()
+    end_time = time.time()
+    logging.debug(f"apply_ratings executed in {end_time - start_time:.2f} seconds")
+
+    # write per stage collapsed stacks and hot functions
+    if profiler:
+        profiler.stop()
+        profiler.write(os.path.join(directory, '.image-ranking-profile'))
+
+    # log adaptive scheduler choices
+    if args.adaptive and hasattr(core.executor, 'report'):
+        core.executor.report()
+
+    # log run statistics
+    report_decode_memory()
+    stats_log()
+
+
+# main entry point
+if __name__ == '__main__':
+
+    # init
+    start_time = time.time()
+    default_threads = os.cpu_count() if os.cpu_count() else 4
+
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='run blur detection on a single image')
+
+    parser.add_argument('directory', type=str, nargs='?', help='directory of images')
+    parser.add_argument('--batch', metavar='dir', nargs='+', default=None,
+                        help='rank many directories or glob patterns in one process, sharing the worker pool')
+
+    parser.add_argument('-f', '--feature_matching', action='store_true',
+                        help='feature matching mode')
+    parser.add_argument('--matcher', metavar='str', default='bruteforce', choices=MATCHERS,
+                        help='feature matching descriptor matcher (bruteforce, flann, ratio)')
+    parser.add_argument('-e', '--exclude', action='store_true',
+                        help='exclude files with existing xmp')
+    parser.add_argument('--journal', action='store_true',
+                        help='journal blur values, groups and ratings next to the images so an interrupted run can be resumed')
+    parser.add_argument('--resume', action='store_true',
+                        help='resume an interrupted run from its journal, skipping finished work and written ratings '
+                             '(implies --journal)')
+
+    parser.add_argument('--duplicates', metavar='str', default='off', choices=('off', 'skip', 'report'),
+                        help='byte identical files: off, skip (inherit the first copy\'s results), report (list only)')
+
+    parser.add_argument('-d', '--diff', metavar='float', type=float, default=0,
+                        help='image difference threshold')
+
+    parser.add_argument('-m', '--max_rank', metavar='int', type=int, default=3,
+                        help='max image rank (1 to 5)')
+    parser.add_argument('-t', '--threads', metavar='int', type=int, default=default_threads,
+                        help='number of threads')
+    parser.add_argument('--read_ahead', metavar='size', type=parse_size, default=0,
+                        help='read-ahead byte budget for prefetching files (e.g. 512M, 0 disables)')
+    parser.add_argument('--io_threads', metavar='int', type=int, default=8,
+                        help='number of read-ahead I/O threads')
+    parser.add_argument('--max_decode_memory', metavar='size', type=parse_size, default=0,
+                        help='memory budget of concurrent decodes estimated from image headers '
+                             '(e.g. 8G, 0 disables)')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='size each stage\'s workers from its measured cpu/io profile and throughput, '
+                             'coordinating OpenCV threads')
+    parser.add_argument('--shards', metavar='int', type=int, default=0,
+                        help='split images into time contiguous shards processed by worker processes')
+    parser.add_argument('--shard_index', metavar='int', type=int, default=None,
+                        help='only process this shard and save it to the shard directory (multi node runs)')
+    parser.add_argument('--shard_dir', metavar='path', default=None,
+                        help='shared shard result directory (default: <directory>/.shards)')
+    parser.add_argument('--merge_shards', action='store_true',
+                        help='merge saved shard results and apply ratings')
+    parser.add_argument('-l', '--limit', metavar='int', type=int, default=250,
+                        help='max number of images to process')
+
+    parser.add_argument('--similarity_resize', metavar='(width, height)', type=tuple, default=None,
+                        help='similarity detection image size, supports keywords "half/third/quarter"')
+    parser.add_argument('--similarity_crop', metavar='int', default=15,
+                        help='similarity detection crop mask (in %)')
+    parser.add_argument('--similarity_blur', metavar='[5]', type=str, nargs='+', default=[5],
+                        help='List of radii for Gaussian blur applied before similarity detection')
+    parser.add_argument('--similarity_min_contour', metavar='int', type=int, default=500,
+                        help='Similarity minimum contour area')
+    parser.add_argument('--similarity_delta', metavar='int', type=int, default=25,
+                        help='Similarity delta threshold')
+    parser.add_argument('--arena', action='store_true',
+                        help='store similarity images in one shared memory block')
+    parser.add_argument('--arena_file', action='store_true',
+                        help='persist the similarity image arena next to the images and reuse it on re-runs')
+    parser.add_argument('--partition_gap', metavar='float', type=float, default=0,
+                        help='split groups at capture time gaps (seconds) and drive mode sequence changes, '
+                             'partitions are grouped in parallel (0 disables)')
+    parser.add_argument('--cascade_band', metavar='float', type=float, nargs=2, default=None,
+                        help='coarse thumbnail compare band (low high multiples of the --diff threshold), '
+                             'pairs below low are grouped and above high are split without a full compare, '
+                             'ignored with --feature_matching')
+
+    parser.add_argument('--blur_mode', metavar='str', default='sum_modified_laplacian',
+                        help='blur detection algorithm (sum_modified_laplacian, sobel, laplacian)')
+    parser.add_argument('--blur_crop', metavar='int', default=30,
+                        help='blur detection crop mask (in %)')
+    parser.add_argument('--blur_resize', metavar='(width, height)', type=tuple, default=None,
+                        help='blur detection image size, supports keywords "half/third/quarter"')
+    parser.add_argument('--blur_window', metavar='int', type=int, default=0,
+                        help='score a full resolution window of this size (pixels) around the EXIF focus point, '
+                             'image centre without focus data (0 disables)')
+    parser.add_argument('--blur_tolerance', metavar='float', type=float, default=0,
+                        help='progressive blur ranking on sampled tiles, error probability at each rank boundary '
+                             '(e.g. 0.05, 0 disables)')
+    parser.add_argument('--blur_scaled_decode', action='store_true',
+                        help='decode JPEG files for blur detection at the half or quarter --blur_resize scale '
+                             'instead of full size')
+    parser.add_argument('--lazy_blur', action='store_true',
+                        help='only calculate blur for images that share a group with other images, '
+                             'scored per group while grouping continues')
+
+    parser.add_argument('--sweep', metavar='path', default=None,
+                        help='parameter grid json to sweep against --ground_truth instead of rating')
+    parser.add_argument('--ground_truth', metavar='path', default=None,
+                        help='ground truth grouping json for --sweep, {"filename": "group label"}')
+
+    parser.add_argument('--serve', action='store_true',
+                        help='run as a local ranking service, keeping pools and caches warm')
+    parser.add_argument('--host', metavar='str', default='127.0.0.1',
+                        help='ranking service host')
+    parser.add_argument('--port', metavar='int', type=int, default=8765,
+                        help='ranking service port')
+    parser.add_argument('--server', metavar='url', default=None,
+                        help='submit to a running ranking service, e.g. http://127.0.0.1:8765')
+    parser.add_argument('--priority', metavar='int', type=int, default=0,
+                        help='ranking service job priority, lower runs first')
+
+    parser.add_argument('--profile', action='store_true',
+                        help='sample all threads per stage, writes collapsed stacks and logs hot functions')
+    parser.add_argument('-v', '--verbose', action='store_true', help='set logging level to debug')
+
+    # show help if no args
+    import sys
+    if len(sys.argv) == 1:
+        parser.print_help(sys.stderr)
+        exit(1)
+
+    # parse args
+    args = parser.parse_args();
+
+    # debug
+    if args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    # conditional defaults, a resumed run keeps journaling
+    apply_defaults(args)
+    args.journal = args.journal or args.resume
+
+    # run main process
+    try:
+        main(args)
+
+    except KeyboardInterrupt:
+        logging.warning("process interrupted by user" + (", run again with --resume to continue" if args.journal else ""))
+
+    # free-threaded interpreters run worker threads in parallel unless an extension module needs the GIL
+    log_gil_status()
+
+    # end
+    end_time = time.time()
+    logging.info(f"execution time {end_time - start_time:.2f} seconds")
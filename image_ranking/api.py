@@ -0,0 +1,140 @@
+import logging
+
+from collections import deque
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+from image_ranking.config import RankingConfig
+from image_ranking.core import rank_group
+from image_ranking.image_group import ImageGrouper
+from image_ranking.image_hash import ImageHash
+from image_ranking.stats import stats_add
+
+
+@dataclass
+class RankedImage:
+    id: str
+    rating: int
+    blur: float
+    metadata: dict
+
+
+@dataclass
+class RankedGroup:
+    id: str
+    images: list
+
+
+class Ranker:
+
+    """
+    Embeddable ranker for in-memory images, groups and rates an iterable of
+    (id, bytes or ndarray, metadata) and yields groups as they close.
+    The worker pool is created once and reused across calls.
+    :param config: ranking configuration
+    """
+    def __init__(self, config: RankingConfig = None):
+        self.config = config or RankingConfig()
+        self.executor = ThreadPoolExecutor(max_workers=self.config.threads)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def close(self):
+        self.executor.shutdown()
+
+
+    def rank(self, items: Iterable[tuple]) -> Iterator[RankedGroup]:
+        """
+        Group and rate images in order
+        :param items: iterable of tuple(id, bytes or ndarray, metadata)
+        :return: ranked groups, in input order
+        """
+
+        grouper = ImageGrouper()
+        group = []
+        closed = deque()
+
+        for image in self.initialize(items):
+
+            # close current group when the image starts a new one
+            if grouper.add(image) and group:
+                closed.append(self.close_group(group))
+                group = []
+            group.append(image)
+
+            # yield finished groups without waiting on later ones
+            while closed and all(future.done() for future in closed[0][1]):
+                yield self.ranked_group(*closed.popleft())
+
+        # close last group
+        if group:
+            closed.append(self.close_group(group))
+        while closed:
+            yield self.ranked_group(*closed.popleft())
+
+
+    def initialize(self, items: Iterable[tuple]) -> Iterator[ImageHash]:
+
+        # initialize images on the pool in order, bounded look-ahead
+        pending = deque()
+        for item in items:
+            pending.append(self.executor.submit(self.initialize_image, *item))
+            if len(pending) >= self.config.threads * 2:
+                image = pending.popleft().result()
+                if image: yield image
+
+        while pending:
+            image = pending.popleft().result()
+            if image: yield image
+
+
+    def initialize_image(self, id: str, data, metadata: dict = None) -> ImageHash | None:
+        try:
+            image = ImageHash(id, self.config, data, metadata)
+            image.initialize()
+            return image
+
+        except Exception as e:
+            logging.error(f"Error initializing image {id}: {e}")
+            return None
+
+
+    def close_group(self, images: list) -> tuple:
+        # a single image gets max_rank without blur
+        if self.config.lazy_blur and len(images) == 1:
+            stats_add("blur_skipped")
+            images[0].rank = self.config.max_rank
+            return images, []
+
+        # calculate blur for the closed group
+        return images, [self.executor.submit(image.calculate_blur) for image in images]
+
+
+    def ranked_group(self, images: list, futures: list) -> RankedGroup:
+
+        # rank images, images that failed blur are unrated, lazy singletons are already ranked
+        if futures:
+            for future in futures:
+                future.result()
+            failed = [image for image in images if image.blur is None]
+            images = [image for image in images if image.blur is not None]
+            rank_group(images, self.config.max_rank)
+            images += failed
+
+        # release image data
+        for image in images:
+            image.data = None
+
+        # the root image's id, content hashes of separate groups can be equal
+        root = (images[0].root or images[0]) if images else None
+        return RankedGroup(
+            id=root.filename if root else None,
+            images=[RankedImage(image.filename, image.rank, image.blur, image.metadata) for image in images])
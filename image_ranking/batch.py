@@ -0,0 +1,149 @@
+import os
+import copy
+import glob
+import time
+import logging
+import argparse
+
+from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
+
+from image_ranking.core import Core, get_rating_groups
+from image_ranking.journal import RunJournal
+from image_ranking.progress import set_progress
+
+
+def get_batch_directories(patterns: list, base: str = None) -> list:
+    """
+    Expand directories and glob patterns, in order without repeats
+    :param patterns: directories or glob patterns
+    :param base: directory relative patterns are resolved against
+    :return: a list of absolute directory paths
+    """
+    directories = []
+    for pattern in patterns:
+        if base is not None and not os.path.isabs(pattern):
+            pattern = os.path.join(base, pattern)
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            match = os.path.abspath(match)
+            if os.path.isdir(match) and match not in directories:
+                directories.append(match)
+            elif not glob.has_magic(pattern):
+                logging.warning(f"directory: {match} is not a valid directory, skipping")
+    return directories
+
+
+class BatchDirectory:
+
+    """
+    Single directory of a batch run
+    :param args: arguments namespace for the directory
+    """
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.core = None
+        self.images = 0
+        self.groups = 0
+        self.seconds = 0
+        self.error = None
+
+
+def run_batch(args: argparse.Namespace, base: str = None) -> list:
+    """
+    Rank many directories in one process, the worker pool is shared and the
+    next directory is listed and decoded while the previous one is grouped,
+    blur scored and rated. Groups never span directories.
+    :param args: arguments namespace, args.batch holds directories or glob patterns
+    :param base: directory relative patterns are resolved against
+    :return: a list of BatchDirectory
+    """
+    directories = get_batch_directories(args.batch, base)
+    logging.info(f"batch: {len(directories)} directories")
+    if len(directories) == 0:
+        return []
+
+    # per directory arguments
+    batch = []
+    for directory in directories:
+        directory_args = copy.copy(args)
+        directory_args.directory = directory
+        batch.append(BatchDirectory(directory_args))
+
+    # shared worker pool, adaptive when requested
+    if args.adaptive:
+        from image_ranking.scheduler import StageScheduler
+        executor = StageScheduler(args.threads)
+    else:
+        executor = ThreadPoolExecutor(max_workers=args.threads)
+
+    # list and decode a directory
+    def prepare(item: BatchDirectory):
+        start_time = time.time()
+        journal = RunJournal(item.args, args.resume) if args.journal else None
+        item.core = Core(item.args, executor, journal=journal)
+        item.core.get_and_hash_images()
+        item.seconds += time.time() - start_time
+        return item
+
+    # one global progress bar of rated images, totals grow as directories are listed
+    set_progress(False)
+    bar = tqdm(total=0, ascii=' =', unit='img')
+    try:
+        with executor, ThreadPoolExecutor(max_workers=1) as ahead:
+            pending = ahead.submit(prepare, batch[0])
+            for i, item in enumerate(batch):
+
+                # wait for the directory, start decoding the next one
+                try:
+                    pending.result()
+                except Exception as e:
+                    item.error = str(e)
+                if i + 1 < len(batch):
+                    pending = ahead.submit(prepare, batch[i + 1])
+                if item.error:
+                    logging.error(f"{item.args.directory} failed: {item.error}")
+                    continue
+
+                bar.total += len(item.core.images_list)
+                bar.set_description(os.path.basename(item.args.directory))
+                bar.refresh()
+
+                # group, blur and rate on the shared pool
+                try:
+                    start_time = time.time()
+                    item.core.group()
+                    item.core.calculate_blur()
+                    item.core.apply_ratings()
+                    item.seconds += time.time() - start_time
+                except Exception as e:
+                    item.error = str(e)
+                    logging.error(f"{item.args.directory} failed: {item.error}", exc_info=True)
+
+                item.images = len(item.core.images_list)
+                item.groups = len(get_rating_groups(item.core.images_list))
+                bar.update(item.images)
+
+                # release decoded images of finished directories
+                item.core = None
+
+    finally:
+        bar.close()
+        set_progress(True)
+
+    if args.adaptive:
+        executor.report()
+    log_batch(batch)
+    return batch
+
+
+def log_batch(batch: list):
+    # batch summary, per directory and totals
+    message = "batch summary:"
+    for item in batch:
+        status = f"failed: {item.error}" if item.error else f"{item.images} images, {item.groups} groups"
+        message += f"\n  {item.args.directory}: {status} ({item.seconds:.2f} seconds)"
+    done = [item for item in batch if not item.error]
+    message += (f"\n  total: {len(done)}/{len(batch)} directories, {sum(item.images for item in done)} images, "
+                f"{sum(item.groups for item in done)} groups")
+    logging.info(message)
@@ -0,0 +1,34 @@
+import json
+import time
+import urllib.request
+
+
+def submit_job(server: str, options: dict, priority: int = 0) -> dict:
+    """
+    Submit a ranking job to a running service
+    :param server: service url, e.g. http://127.0.0.1:8765
+    :param options: RankingConfig fields, directory is required
+    :param priority: lower runs first
+    :return: job status
+    """
+    body = json.dumps(dict(options, priority=priority), default=str).encode()
+    request = urllib.request.Request(
+        f"{server.rstrip('/')}/jobs", data=body, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def get_job(server: str, id: int) -> dict:
+    with urllib.request.urlopen(f"{server.rstrip('/')}/jobs/{id}") as response:
+        return json.loads(response.read())
+
+
+def wait_job(server: str, id: int, interval: float = 0.2, callback: callable = None) -> dict:
+    # poll job until done or failed
+    while True:
+        status = get_job(server, id)
+        if callback:
+            callback(status)
+        if status['stage'] == 'done' or status['error']:
+            return status
+        time.sleep(interval)
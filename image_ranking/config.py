@@ -0,0 +1,84 @@
+import os
+from dataclasses import dataclass, field
+
+
+@dataclass
+class RankingConfig:
+
+    """
+    Typed ranking configuration, attribute compatible with the command line
+    arguments namespace so it can be passed wherever args are expected
+    """
+
+    # input
+    directory: str = None
+    exclude: bool = False
+    limit: int = 250
+    duplicates: str = 'off'
+
+    # grouping
+    feature_matching: bool = False
+    matcher: str = 'bruteforce'
+    diff: float = 0
+    cascade_band: tuple = None
+    partition_gap: float = 0
+
+    # ranking
+    max_rank: int = 3
+
+    # workers
+    threads: int = os.cpu_count() or 4
+    read_ahead: int = 0
+    io_threads: int = 8
+    adaptive: bool = False
+
+    # sharding
+    shards: int = 0
+    shard_index: int = None
+    shard_dir: str = None
+    merge_shards: bool = False
+
+    # similarity detection
+    similarity_resize: tuple = None
+    similarity_crop: int = 15
+    similarity_blur: list = field(default_factory=lambda: [5])
+    similarity_min_contour: int = 500
+    similarity_delta: int = 25
+    arena: bool = False
+    arena_file: bool = False
+
+    # blur detection
+    blur_mode: str = 'sum_modified_laplacian'
+    blur_crop: int = 30
+    blur_resize: tuple = None
+    blur_window: int = 0
+    blur_tolerance: float = 0
+    blur_scaled_decode: bool = False
+    lazy_blur: bool = False
+
+    verbose: bool = False
+
+    def __post_init__(self):
+        apply_defaults(self)
+
+
+def apply_defaults(args):
+    """
+    Apply defaults that depend on other options
+    :param args: arguments namespace or RankingConfig
+    """
+    if args.diff <= 0:
+        if args.feature_matching:
+            args.diff = 0.4
+        else:
+            args.diff = 0.6
+    if args.similarity_resize is None:
+        if args.feature_matching:
+            args.similarity_resize = ('quarter', 'quarter')
+        else:
+            args.similarity_resize = (144, 196)
+    if args.blur_resize is None:
+        args.blur_resize = ('half', 'half')
+    if args.feature_matching:
+        # the coarse thumbnail compare approximates the contour score only
+        args.cascade_band = None
@@ -1,149 +1,400 @@
-import argparse
-import logging
-from tqdm import tqdm
-import concurrent.futures
-
-from image_ranking.image_hash import ImageHash
-
-from image_ranking.get_and_hash_images import get_and_hash_images
-from image_ranking.darktable_set_rating import darktable_set_rating
-
-
-# main process class
-class Core(object):
-
-    """
-    Main process class
-    Steps:
-    1. get and hash images
-    2. group images by hash / similarity
-    3. calculate blur value for each image in the group
-    4. iterate image groups, rank by blur value, update xmp rating
-    """
-    def __init__(self, args: argparse.Namespace):
-        self.images_list = []
-        self.args = args
-
-
-    def get_and_hash_images(self):
-        self.images_list = get_and_hash_images(self.args)
-
-
-    def group(self):
-
-        # validate images array not empty
-        if len(self.images_list) < 2:
-            return
-
-        logging.info("group")
-        # group all image
-        for i in tqdm(range(0, len(self.images_list)), ascii=' ='):
-            for j in range(i + 1, len(self.images_list)):
-
-                i1 = self.images_list[i]
-                i2 = self.images_list[j]
-
-                # if i2 already has a root, skip
-                if i2.root: break
-
-                # if i1 has no root and is same group, set i1 as i2's root
-                if i1.is_same_group(i2):
-                    if i1.root:
-                        i2.root = i1.root
-                    else:
-                        i2.root = i1
-
-                else: break
-
-
-    def calculate_blur(self):
-        logging.info("calculate_blur")
-
-        # calculate blur in parallel
-        def blur(image: ImageHash):
-            return image.calculate_blur()
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.args.threads) as executor:
-            result = list(tqdm(executor.map(blur, self.images_list), total=len(self.images_list), ascii=' ='))
-
-
-    def apply_ratings(self):
-        logging.info("apply_ratings")
-
-        # initialize
-        image_group = list()
-        previous_group_hash = None
-        group_hash = None
-
-        # iterate all images
-        image: ImageHash
-        for image in tqdm(self.images_list, ascii=' ='):
-
-            # set current group
-            group_hash = image.root_hash
-
-            # if group changed, apply ratings
-            if group_hash != previous_group_hash:
-
-                # process current group
-                if previous_group_hash is not None:
-                    self.apply_group_ratings(image_group, group_hash)
-
-                # reset for new group
-                previous_group_hash = group_hash
-                image_group = list()
-
-            # add image to current group
-            image_group.append(image)
-
-        # process last group
-        self.apply_group_ratings(image_group, group_hash)
-
-
-    def apply_group_ratings(self, images: list, group_hash: str = None):
-
-        # validate images array
-        if len(images) == 0:
-            return
-
-        # sort images
-        images.sort(key=lambda x: x.blur, reverse=True)
-
-        # set initial rank
-        rank = self.args.max_rank
-
-        # set debug group
-        message = f"\ngroup: {group_hash}\n  metric: {images[0].metric}"
-
-        # iterate images
-        i = 0
-        next = 1
-        image: ImageHash
-        for image in images:
-
-            # set rank
-            image.rank = rank
-            # increment files
-            i += 1
-
-            # decrement rank, distribute results
-            if i == next:
-                next = next * 2 + i
-                if next * 2 > len(images):
-                    next -= 1
-                if rank > 0: rank -= 1
-
-            # debug print
-            message += f"\n  file: {image.filename} \n    blur: {image.blur} \n    rank: {image.rank}"
-            for s in image.similar:
-                message += f"\n    similarity: {s[0]} ({s[1]},{s[2]})"
-
-        # debug print
-        logging.debug(message)
-
-        #apply ratings in parallel
-        def rate_image(image: ImageHash):
-            darktable_set_rating(f"{image.path}.xmp", image.filename, image.rank, True)
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.args.threads) as executor:
-            executor.map(rate_image, images)
+import argparse
+import logging
+import concurrent.futures
+
+from image_ranking.image_hash import ImageHash
+from image_ranking.image_group import ImageGrouper
+
+from image_ranking.get_and_hash_images import get_and_hash_images, enumerate_list, enumerate_read_ahead
+from image_ranking.stats import stats_add
+from image_ranking.progress import progress
+from image_ranking.darktable_set_rating import darktable_set_rating
+
+
+def get_group_ranks(count: int, max_rank: int) -> list:
+    """
+    Ranks by position for a group sorted by blur, from max_rank to zero
+    :param count: number of images in the group
+    :param max_rank: rank of the sharpest image
+    :return: a list of ranks
+    """
+    ranks = []
+
+    # set initial rank
+    rank = max_rank
+
+    # iterate positions
+    i = 0
+    next = 1
+    for _ in range(count):
+
+        # set rank
+        ranks.append(rank)
+        # increment files
+        i += 1
+
+        # decrement rank, distribute results
+        if i == next:
+            next = next * 2 + i
+            if next * 2 > count:
+                next -= 1
+            if rank > 0: rank -= 1
+
+    return ranks
+
+
+def get_rating_groups(images: list) -> list:
+    """
+    Split images into the groups ratings are applied to, consecutive images with the same root hash
+    :param images: grouped images in capture order
+    :return: a list of image lists
+    """
+    groups = []
+    group_hash = None
+    for image in images:
+        if not groups or image.root_hash != group_hash:
+            groups.append([])
+            group_hash = image.root_hash
+        groups[-1].append(image)
+    return groups
+
+
+def rank_group(images: list, max_rank: int):
+
+    # sort images
+    images.sort(key=lambda x: x.blur, reverse=True)
+
+    # set ranks
+    for image, rank in zip(images, get_group_ranks(len(images), max_rank)):
+        image.rank = rank
+
+
+# main process class
+class Core(object):
+
+    """
+    Main process class
+    Steps:
+    1. get and hash images
+    2. group images by hash / similarity
+    3. calculate blur value for each image in the group
+    4. iterate image groups, rank by blur value, update xmp rating
+    """
+    def __init__(self, args: argparse.Namespace, executor: concurrent.futures.ThreadPoolExecutor = None,
+                 cache=None, journal=None):
+        self.images_list = []
+        self.args = args
+
+        # shared worker pool and stage output cache, used by the ranking service
+        self.executor = executor
+        self.cache = cache
+
+        # crash-safe run journal
+        self.journal = journal
+
+        # adaptive per stage worker counts
+        if executor is None and getattr(args, 'adaptive', False):
+            from image_ranking.scheduler import StageScheduler
+            self.executor = StageScheduler(args.threads)
+
+        # grouping state after the last image, (root, anchor, previous)
+        self.group_state = (None, None, None)
+
+        # lazy blur, futures and ids of images scored while grouping and the open rating group
+        self.blur_futures = []
+        self.blur_scheduled = set()
+        self.blur_group = []
+        self.blur_executor = None
+
+
+    def get_and_hash_images(self):
+        self.images_list = get_and_hash_images(self.args, self.executor, self.cache, self.journal)
+
+
+    def group(self):
+
+        # validate images array not empty
+        if len(self.images_list) == 0:
+            return
+
+        # partition by capture time and drive mode sequence
+        if self.args.partition_gap > 0:
+            self.group_partitions()
+            return
+
+        logging.info("group")
+
+        # groups closed before the run was interrupted
+        images = self.images_list
+        if self.journal is not None:
+            images = self.journal.restore_groups(images)
+
+        # group all images in sequence
+        grouper = ImageGrouper()
+        group = []
+        for image in progress(images):
+            if grouper.add(image) and group:
+                self.close_group(group)
+                group = []
+            group.append(image)
+        if group:
+            self.close_group(group)
+        self.schedule_blur([])
+
+        # save state for continuing across shard boundaries
+        self.group_state = grouper.state
+
+
+    def group_partitions(self):
+        logging.info("group partitions")
+
+        # groups closed before the run was interrupted
+        images = self.images_list
+        if self.journal is not None:
+            images = self.journal.restore_groups(images)
+        if len(images) == 0:
+            return
+
+        # partitions always start a new group
+        from image_ranking.image_partition import partition_images
+        partitions = partition_images(images, self.args.partition_gap)
+
+        # group partitions in parallel
+        def group_partition(images: list) -> tuple:
+            grouper = ImageGrouper()
+            for image in images:
+                grouper.add(image)
+            return grouper.state
+
+        states = enumerate_list(group_partition, partitions, self.args.threads, self.executor)
+
+        # sequential grouping compares the anchor and the previous image at each boundary,
+        # pairs with mismatching exif would have been split without a pixel compare too
+        from image_ranking.image_exif import exif_match
+        avoided = 0
+        for (root, anchor, previous), partition in zip(states[:-1], partitions[1:]):
+            pairs = [anchor] if anchor is previous else [anchor, previous]
+            avoided += sum(1 for image in pairs if exif_match(image.exif, partition[0].exif))
+        stats_add("partitions", len(partitions))
+        stats_add("partition_compares_avoided", avoided)
+
+        # record groups in capture order
+        if self.journal is not None:
+            group = []
+            for image in images:
+                if image.root is None and group:
+                    self.journal.group(group)
+                    group = []
+                group.append(image)
+            self.journal.group(group)
+
+        # save state for continuing across shard boundaries
+        self.group_state = states[-1]
+
+
+    def close_group(self, images: list):
+        if self.journal is not None:
+            self.journal.group(images)
+
+        # groups with the same root hash are rated together, schedule once the hash changes
+        if self.blur_group and self.blur_group[0].root_hash != images[0].root_hash:
+            self.schedule_blur(images)
+        else:
+            self.blur_group.extend(images)
+
+
+    def schedule_blur(self, images: list):
+        """
+        Start blur scoring of the closed rating group on the pool while grouping
+        continues, a group of one image gets max_rank without a blur value
+        :param images: first group of the next rating group
+        """
+        group, self.blur_group = self.blur_group, list(images)
+        if not self.args.lazy_blur or self.args.read_ahead > 0 or len(group) < 2:
+            return
+
+        if self.executor is None and self.blur_executor is None:
+            self.blur_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.args.threads)
+        executor = self.executor or self.blur_executor
+        self.blur_scheduled.update(id(image) for image in group)
+        if self.is_progressive():
+            self.blur_futures.append(executor.submit(self.blur_progressive, group))
+        else:
+            self.blur_futures.extend(executor.submit(self.restore_blur, image) for image in group)
+
+
+    def restore_blur(self, image: ImageHash) -> bool:
+        # restore cached or journaled blur value, calculate otherwise
+        cache = self.cache if self.cache is not None else self.journal
+        if cache is not None and cache.restore(image, "blur"):
+            return True
+        return self.blur(image, None)
+
+
+    def blur(self, image: ImageHash, data: bytes) -> bool:
+        result = image.calculate_blur(data)
+        cache = self.cache if self.cache is not None else self.journal
+        if result and cache is not None:
+            cache.store(image, "blur")
+        return result
+
+
+    def is_progressive(self) -> bool:
+        return self.args.blur_tolerance > 0
+
+
+    def blur_progressive(self, images: list) -> bool:
+        """
+        Progressive blur of a rating group, scored on sampled tiles until the
+        order at every rank boundary is known within the tolerance
+        :param images: images of one rating group
+        """
+        cache = self.cache if self.cache is not None else self.journal
+        if cache is not None and all([cache.restore(image, "blur") for image in images]):
+            return True
+
+        # estimates depend on the whole group, score every frame together
+        from image_ranking.image_blur import get_blur_image, rank_blur_progressive
+        crops = [get_blur_image(image.path, image.content_type, self.args.blur_resize, self.args.blur_crop,
+                                image.data, image.get_blur_window(), self.args.blur_scaled_decode)
+                 for image in images]
+        scored = [(image, crop) for image, crop in zip(images, crops) if crop is not None]
+        scores, pixels, counts = rank_blur_progressive(
+            [crop for image, crop in scored],
+            get_group_ranks(len(scored), self.args.max_rank),
+            self.args.blur_mode,
+            self.args.blur_tolerance)
+
+        for (image, crop), score in zip(scored, scores):
+            image.blur = score
+            if cache is not None:
+                cache.store(image, "blur")
+        stats_add("blur_pixels", sum(pixels))
+        stats_add("blur_pixels_full", sum(counts))
+        stats_add("blur_stopped_early", sum(1 for done, count in zip(pixels, counts) if done < count))
+        return True
+
+
+    def calculate_blur(self):
+        logging.info("calculate_blur")
+
+        # rating groups left after grouping, lazy blur skips images alone in their group
+        groups = []
+        for group in get_rating_groups(self.images_list):
+            if self.args.lazy_blur and len(group) < 2:
+                stats_add("blur_skipped", len(group))
+            elif any(id(image) not in self.blur_scheduled and image.blur is None for image in group):
+                groups.append(group)
+
+        # groups are scored together, otherwise every image on its own
+        if self.is_progressive():
+            enumerate_list(self.blur_progressive, groups, self.args.threads, self.executor)
+
+        else:
+
+            # restore cached or journaled blur values
+            images = [image for group in groups for image in group
+                      if id(image) not in self.blur_scheduled and image.blur is None]
+            cache = self.cache if self.cache is not None else self.journal
+            if cache is not None:
+                images = [image for image in images if not cache.restore(image, "blur")]
+
+            # calculate blur in parallel
+            enumerate_read_ahead(self.blur, images, lambda image: image.path, self.args, "blur", self.executor)
+
+        # wait for groups scored while grouping
+        if self.blur_futures:
+            for future in progress(self.blur_futures, total=len(self.blur_futures)):
+                future.result()
+            self.blur_futures = []
+        if self.blur_executor is not None:
+            self.blur_executor.shutdown()
+            self.blur_executor = None
+
+
+    def apply_ratings(self):
+        logging.info("apply_ratings")
+
+        # initialize
+        image_group = list()
+        previous_group_hash = None
+        group_hash = None
+
+        # iterate all images
+        image: ImageHash
+        for image in progress(self.images_list):
+
+            # set current group
+            group_hash = image.root_hash
+
+            # if group changed, apply ratings
+            if group_hash != previous_group_hash:
+
+                # process current group
+                if previous_group_hash is not None:
+                    self.apply_group_ratings(image_group, group_hash)
+
+                # reset for new group
+                previous_group_hash = group_hash
+                image_group = list()
+
+            # add image to current group
+            image_group.append(image)
+
+        # process last group
+        self.apply_group_ratings(image_group, group_hash)
+
+        # run completed
+        if self.journal is not None:
+            self.journal.finish()
+
+
+    def apply_group_ratings(self, images: list, group_hash: str = None):
+
+        # validate images array
+        if len(images) == 0:
+            return
+
+        # sort and rank images
+        rank_group(images, self.args.max_rank)
+
+        # set debug group
+        message = f"\ngroup: {group_hash}\n  metric: {images[0].metric}"
+
+        # iterate images
+        image: ImageHash
+        for image in images:
+
+            # debug print
+            message += f"\n  file: {image.filename} \n    blur: {image.blur} \n    rank: {image.rank}"
+            for s in image.similar:
+                message += f"\n    similarity: {s[0]} ({s[1]},{s[2]})"
+            for duplicate in image.duplicates:
+                message += f"\n    duplicate: {duplicate.filename}"
+
+        # debug print
+        logging.debug(message)
+
+        # duplicates inherit the original's results
+        for image in list(images):
+            for duplicate in image.duplicates:
+                duplicate.blur = image.blur
+                duplicate.rank = image.rank
+                duplicate.root = image.root or image
+                images.append(duplicate)
+
+        #apply ratings in parallel
+        def rate_image(image: ImageHash):
+
+            # never write a rating twice on resume
+            if self.journal is not None and self.journal.is_rated(image):
+                return
+            darktable_set_rating(f"{image.path}.xmp", image.filename, image.rank, True)
+            if self.journal is not None:
+                self.journal.rating(image)
+
+        if self.executor is not None:
+            list(self.executor.map(rate_image, images))
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.args.threads) as executor:
+                executor.map(rate_image, images)
@@ -1,192 +1,325 @@
-import cv2
-import imutils
-import argparse
-import numpy as np
-
-def cv2_process_image(path: str, content_type: str, args: argparse.Namespace, debug: bool = False):
-
-    # get image
-    image = cv2_get_image(path, content_type, True)
-
-    # resize image
-    if args.similarity_resize is not None:
-        image = cv2_resize(image, args.similarity_resize)
-        if debug:
-            cv2.imshow("resize", image)
-
-    # guassian blur
-    blur = args.similarity_blur
-    for radius in blur:
-        if radius is not None:
-
-            # ensure radius is at least 1
-            if radius < 1:
-                radius = 1
-
-            # ensure radius is odd
-            if radius % 2 == 0:
-                radius += 1
-
-            # apply blur
-            image = cv2.GaussianBlur(image, (radius, radius), 0)
-            if debug:
-                cv2.imshow(f"blur{radius}", image)
-
-    # apply crop
-    crop = args.similarity_crop
-    if crop > 0:
-        image = cv2_crop(image, args.similarity_crop)
-        if debug:
-            cv2.imshow(f"crop{crop}", image)
-
-    if debug:
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
-
-    # return image data
-    return image
-
-
-def cv2_get_image(path: str, content_type: str, grayscale: bool = False):
-
-    image = None
-
-    # read image (raw)
-    from image_ranking.content_type import is_raw_image_file
-    if is_raw_image_file(content_type):
-        import rawpy
-        with rawpy.imread(path) as raw:
-            image = raw.postprocess(output_color=rawpy.ColorSpace.sRGB)
-            image = cv2.cvtColor(image, cv2_get_rgb_color_map(grayscale))
-
-    # read image (heic)
-    elif content_type == 'image/heic':
-        from PIL import Image
-        import pillow_heif
-
-        image = pillow_heif.read_heif(path)
-        image = Image.frombytes(
-            image.mode,
-            image.size,
-            image.data,
-            "raw"
-        )
-        image = np.array(image)
-        image = cv2.cvtColor(image, cv2_get_rgb_color_map(grayscale))
-
-    # read image (normal)
-    else:
-        image = cv2.imread(path, cv2.IMREAD_COLOR)
-        if grayscale:
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-    # return image data
-    return image
-
-
-def cv2_get_rgb_color_map(grayscale: bool = False):
-    return cv2.COLOR_RGB2GRAY if grayscale else cv2.COLOR_RGB2BGR
-
-
-def cv2_resize(image, shape: tuple):
-
-    # resize image
-    if shape is not None:
-
-        # map strings to float
-        def map_fractional(v) -> float:
-            fractional_map = {
-                "half": 1/2,
-                "third": 1/3,
-                "quarter": 1/4
-            }
-            v = fractional_map.get(v.lower()) if type(v) is str else v
-            return v if v is not None else 1
-
-        if type(shape[0]) is str:
-            shape = (round(image.shape[0] * map_fractional(shape[0])), shape[1])
-        if type(shape[1]) is str:
-            shape = (shape[0], round(image.shape[1] * map_fractional(shape[1])))
-
-        # validate resize
-        if not isinstance(shape[0], int) or not isinstance(shape[1], int):
-            raise ValueError(
-                "resize must be a tuple of two integers or "
-                "fractional strings ('half', 'third', 'quarter')"
-            )
-
-        # resize
-        image = cv2.resize(image, shape)
-
-    # return image data
-    return image
-
-
-def cv2_crop(image, percent):
-
-    # validate crop percentage
-    if percent <= 0 or percent >= 100:
-        raise ValueError("Crop percentage must be between 0 and 100")
-
-    w = image.shape[0] #width
-    h = image.shape[1] #height
-    t = percent / 2 # half of crop from each size
-
-    w_min = int(w * t / 100)
-    h_min = int(h * t / 100)
-
-    w_max = w - w_min
-    h_max = h - h_min
-
-    return image[w_min:w_max, h_min:h_max]
-
-
-def cv2_draw_color_mask(image, borders, color=(0, 0, 0)):
-    w = image.shape[0]
-    h = image.shape[1]
-
-    x_min = int(borders[0] * w / 100)
-    x_max = w - int(borders[2] * w / 100)
-    y_min = int(borders[1] * h / 100)
-    y_max = h - int(borders[3] * h / 100)
-
-    image = cv2.rectangle(image, (0, 0), (x_min, h), color, -1)     # left border
-    image = cv2.rectangle(image, (0, 0), (w, y_min), color, -1)     # top border
-    image = cv2.rectangle(image, (x_max, 0), (w, h), color, -1)     # right border
-    image = cv2.rectangle(image, (0, y_max), (w, h), color, -1)     # bottom border
-
-    return image
-
-
-def cv2_compare_image(a, b, args: argparse.Namespace):
-
-    # validate image shape
-    if a.shape != b.shape:
-        raise ValueError("Images must be the same size for comparison")
-
-    # compute the absolute difference between frames
-    frame_delta = cv2.absdiff(a, b)
-
-    # threshold the delta image
-    thresh = cv2.threshold(frame_delta, args.similarity_delta, 255, cv2.THRESH_BINARY)[1]
-
-    # dilate the thresholded image to fill in holes
-    thresh = cv2.dilate(thresh, None, iterations=2)
-
-    # find contours on thresholded image
-    cnts = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    cnts = imutils.grab_contours(cnts)
-
-    # calculate score and filter by min area
-    score = 0
-    res_cnts = []
-    for c in cnts:
-        if cv2.contourArea(c) < args.similarity_min_contour:
-            continue
-
-        res_cnts.append(c)
-        score += cv2.contourArea(c)
-
-    # return score, contours and threshold image
-    return score, res_cnts, thresh
-
+import io
+import cv2
+import imutils
+import argparse
+import numpy as np
+
+# coarse comparison thumbnail size
+THUMBNAIL_SIZE = (32, 32)
+
+# fractional resize -> libjpeg scaled grayscale decode
+JPEG_SCALED_FLAGS = {
+    'half': cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    'quarter': cv2.IMREAD_REDUCED_GRAYSCALE_4,
+}
+
+def cv2_process_image(path: str, content_type: str, args: argparse.Namespace, debug: bool = False,
+                      data: bytes = None):
+
+    # get resized image
+    image = cv2_get_image(path, content_type, True, data, args.similarity_resize)
+    if debug and args.similarity_resize is not None:
+        cv2.imshow("resize", image)
+
+    # guassian blur
+    blur = args.similarity_blur
+    for radius in blur:
+        if radius is not None:
+
+            # ensure radius is at least 1
+            if radius < 1:
+                radius = 1
+
+            # ensure radius is odd
+            if radius % 2 == 0:
+                radius += 1
+
+            # apply blur
+            image = cv2.GaussianBlur(image, (radius, radius), 0)
+            if debug:
+                cv2.imshow(f"blur{radius}", image)
+
+    # apply crop
+    crop = args.similarity_crop
+    if crop > 0:
+        image = cv2_crop(image, args.similarity_crop)
+        if debug:
+            cv2.imshow(f"crop{crop}", image)
+
+    if debug:
+        cv2.waitKey(0)
+        cv2.destroyAllWindows()
+
+    # return image data
+    return image
+
+
+def cv2_processed_shape(args: argparse.Namespace) -> tuple | None:
+
+    # similarity image shape, None if it depends on the source image size
+    shape = args.similarity_resize
+    if shape is None or not all(isinstance(v, int) for v in shape):
+        return None
+
+    # cv2.resize takes (width, height)
+    height, width = shape[1], shape[0]
+
+    # apply crop, same as cv2_crop
+    crop = args.similarity_crop
+    if crop > 0:
+        t = crop / 2
+        height -= 2 * int(height * t / 100)
+        width -= 2 * int(width * t / 100)
+
+    return height, width
+
+
+def cv2_get_image(path: str, content_type: str, grayscale: bool = False, data=None, resize: tuple = None):
+
+    image = None
+    from image_ranking.content_type import is_raw_image_file
+
+    # decoded image (in-memory numpy array, BGR or grayscale)
+    if isinstance(data, np.ndarray):
+        image = data
+        if grayscale and image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    # decode files within the memory budget
+    else:
+        from image_ranking.decode_memory import decode_admission
+        with decode_admission(path, content_type, data, resize):
+
+            # read image (raw)
+            if is_raw_image_file(content_type):
+                import rawpy
+                with rawpy.imread(io.BytesIO(data) if data is not None else path) as raw:
+                    image = raw.postprocess(output_color=rawpy.ColorSpace.sRGB)
+                    image = cv2.cvtColor(image, cv2_get_rgb_color_map(grayscale))
+
+            # read image (heic)
+            elif content_type == 'image/heic':
+                import pillow_heif
+
+                heif = pillow_heif.open_heif(io.BytesIO(data) if data is not None else path)
+                source, target = cv2_heic_source(heif, resize)
+                if target is not None:
+
+                    # resize before color conversion, fractional sizes are relative to the primary image
+                    image = cv2.resize(np.asarray(source), target)
+                    resize = None
+                else:
+                    image = np.asarray(source)
+
+                # decoder buffer is wrapped, not copied
+                if image.shape[2] == 4:
+                    image = cv2.cvtColor(image, cv2.COLOR_RGBA2GRAY if grayscale else cv2.COLOR_RGBA2BGR)
+                else:
+                    image = cv2.cvtColor(image, cv2_get_rgb_color_map(grayscale))
+
+            # read image (normal)
+            else:
+                if data is not None:
+                    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                else:
+                    image = cv2.imread(path, cv2.IMREAD_COLOR)
+                if grayscale:
+                    image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    # resize image
+    if resize is not None and image is not None:
+        image = cv2_resize(image, resize)
+
+    # return image data
+    return image
+
+
+def cv2_get_scaled_jpeg(path: str, content_type: str, data=None, resize: tuple = None):
+    """
+    Grayscale JPEG decoded at a half or quarter scale by libjpeg, only the low
+    frequency DCT coefficients of each luma block are inverse transformed,
+    chroma is entropy decoded but not transformed and nothing is resized
+    :return: image, None if not a JPEG file or bytes, or the resize is not a scale libjpeg decodes
+    """
+    if content_type != 'image/jpeg' or isinstance(data, np.ndarray) or resize is None:
+        return None
+    flags = {JPEG_SCALED_FLAGS.get(v.lower()) if isinstance(v, str) else None for v in resize}
+    if len(flags) != 1 or None in flags:
+        return None
+    flag = flags.pop()
+
+    from image_ranking.decode_memory import decode_admission
+    with decode_admission(path, content_type, data, resize):
+        if data is not None:
+            return cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+        return cv2.imread(path, flag)
+
+
+def cv2_get_rgb_color_map(grayscale: bool = False):
+    return cv2.COLOR_RGB2GRAY if grayscale else cv2.COLOR_RGB2BGR
+
+
+def cv2_heic_source(heif, resize: tuple = None) -> tuple:
+
+    # primary image, or the smallest embedded thumbnail that still covers the target size
+    source = heif[heif.primary_index]
+    if resize is None:
+        return source, None
+
+    primary = source
+    target = cv2_resize_shape((primary.size[1], primary.size[0]), resize)
+    for i in range(len(primary.info.get('thumbnails', []))):
+        thumbnail = primary.get_thumbnail(i)
+        if (thumbnail.size[0] >= target[0] and thumbnail.size[1] >= target[1]
+                and thumbnail.size[0] < source.size[0]):
+            source = thumbnail
+
+    # return image to decode and target (width, height)
+    return source, target
+
+
+def cv2_resize_shape(size: tuple, shape: tuple) -> tuple:
+
+    # map strings to float
+    def map_fractional(v) -> float:
+        fractional_map = {
+            "half": 1/2,
+            "third": 1/3,
+            "quarter": 1/4
+        }
+        v = fractional_map.get(v.lower()) if type(v) is str else v
+        return v if v is not None else 1
+
+    if type(shape[0]) is str:
+        shape = (round(size[0] * map_fractional(shape[0])), shape[1])
+    if type(shape[1]) is str:
+        shape = (shape[0], round(size[1] * map_fractional(shape[1])))
+
+    # validate resize
+    if not isinstance(shape[0], int) or not isinstance(shape[1], int):
+        raise ValueError(
+            "resize must be a tuple of two integers or "
+            "fractional strings ('half', 'third', 'quarter')"
+        )
+
+    # return cv2 (width, height)
+    return shape
+
+
+def cv2_resize(image, shape: tuple):
+
+    # resize image
+    if shape is not None:
+        shape = cv2_resize_shape(image.shape, shape)
+        image = cv2.resize(image, shape)
+
+    # return image data
+    return image
+
+
+def cv2_crop(image, percent):
+
+    # validate crop percentage
+    if percent <= 0 or percent >= 100:
+        raise ValueError("Crop percentage must be between 0 and 100")
+
+    w = image.shape[0] #width
+    h = image.shape[1] #height
+    t = percent / 2 # half of crop from each size
+
+    w_min = int(w * t / 100)
+    h_min = int(h * t / 100)
+
+    w_max = w - w_min
+    h_max = h - h_min
+
+    return image[w_min:w_max, h_min:h_max]
+
+
+def cv2_window(image, center: tuple, size: int):
+
+    # square window around a fractional (x, y) center, shifted to stay inside the image
+    height, width = image.shape[:2]
+    h, w = min(size, height), min(size, width)
+    top = min(max(0, round(center[1] * height - h / 2)), height - h)
+    left = min(max(0, round(center[0] * width - w / 2)), width - w)
+
+    return image[top:top + h, left:left + w]
+
+
+def cv2_thumbnail(image):
+
+    # area interpolation averages pixels instead of sampling them
+    return cv2.resize(image, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def cv2_coarse_compare(a, b, args: argparse.Namespace, shape: tuple) -> float:
+
+    # thumbnail pixels cover several similarity image pixels
+    scale = shape[0] * shape[1] / a.size
+
+    # compute the absolute difference between thumbnails
+    frame_delta = cv2.absdiff(a, b)
+
+    # threshold the delta image, one dilation at thumbnail scale
+    thresh = cv2.threshold(frame_delta, args.similarity_delta, 255, cv2.THRESH_BINARY)[1]
+    thresh = cv2.dilate(thresh, None, iterations=1)
+
+    # find contours on thresholded image
+    cnts = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    cnts = imutils.grab_contours(cnts)
+
+    # return estimated cv2_compare_image score, contour area scaled to the similarity image
+    areas = [cv2.contourArea(c) * scale for c in cnts]
+    return sum(area for area in areas if area >= args.similarity_min_contour)
+
+
+def cv2_draw_color_mask(image, borders, color=(0, 0, 0)):
+    w = image.shape[0]
+    h = image.shape[1]
+
+    x_min = int(borders[0] * w / 100)
+    x_max = w - int(borders[2] * w / 100)
+    y_min = int(borders[1] * h / 100)
+    y_max = h - int(borders[3] * h / 100)
+
+    image = cv2.rectangle(image, (0, 0), (x_min, h), color, -1)     # left border
+    image = cv2.rectangle(image, (0, 0), (w, y_min), color, -1)     # top border
+    image = cv2.rectangle(image, (x_max, 0), (w, h), color, -1)     # right border
+    image = cv2.rectangle(image, (0, y_max), (w, h), color, -1)     # bottom border
+
+    return image
+
+
+def cv2_compare_image(a, b, args: argparse.Namespace):
+
+    # validate image shape
+    if a.shape != b.shape:
+        raise ValueError("Images must be the same size for comparison")
+
+    # compute the absolute difference between frames
+    frame_delta = cv2.absdiff(a, b)
+
+    # threshold the delta image
+    thresh = cv2.threshold(frame_delta, args.similarity_delta, 255, cv2.THRESH_BINARY)[1]
+
+    # dilate the thresholded image to fill in holes
+    thresh = cv2.dilate(thresh, None, iterations=2)
+
+    # find contours on thresholded image
+    cnts = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    cnts = imutils.grab_contours(cnts)
+
+    # calculate score and filter by min area
+    score = 0
+    res_cnts = []
+    for c in cnts:
+        if cv2.contourArea(c) < args.similarity_min_contour:
+            continue
+
+        res_cnts.append(c)
+        score += cv2.contourArea(c)
+
+    # return score, contours and threshold image
+    return score, res_cnts, thresh
+
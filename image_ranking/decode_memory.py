@@ -0,0 +1,225 @@
+import io
+import os
+import sys
+import time
+import logging
+import threading
+
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from image_ranking.stats import stats_add, stats_set
+
+# estimated bytes per pixel while decoding, including intermediate buffers
+# (raw: 16-bit raw plane, libraw's 4 channel 16-bit working image and the 8-bit rgb output,
+#  heic: rgb(a) decoder buffer and converted copy, others: bgr image and converted copy)
+BYTES_PER_PIXEL = {'raw': 16, 'heic': 8, 'image': 5}
+
+# pixels per file byte when the header has no dimensions
+PIXELS_PER_BYTE = {'raw': 1, 'heic': 10, 'image': 10}
+
+# jpeg start of frame markers, all of 0xc0 - 0xcf except DHT, JPG and DAC
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+MB = 1024 ** 2
+
+
+class DecodeGovernor:
+
+    """
+    Admission control for decodes, every decode acquires its estimated
+    footprint from a memory budget before it starts. Decodes are admitted
+    in arrival order, small files run side by side while a large one waits
+    for enough of the budget, a single decode is always admitted.
+    :param budget: max estimated decode bytes in flight
+    """
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.in_flight = 0
+        self.peak = 0
+        self.waiting = deque()
+        self.condition = threading.Condition()
+
+
+    def acquire(self, size: int):
+        ticket = object()
+        start_time = None
+        with self.condition:
+            self.waiting.append(ticket)
+            while self.waiting[0] is not ticket or (self.in_flight > 0 and self.in_flight + size > self.budget):
+                if start_time is None:
+                    start_time = time.perf_counter()
+                self.condition.wait()
+            self.waiting.popleft()
+            self.in_flight += size
+            self.peak = max(self.peak, self.in_flight)
+            self.condition.notify_all()
+
+        if start_time is not None:
+            stats_add("decode_admission_waits")
+            stats_add("decode_admission_wait_seconds", time.perf_counter() - start_time)
+
+
+    def release(self, size: int):
+        with self.condition:
+            self.in_flight -= size
+            self.condition.notify_all()
+
+
+# process wide governor, None when decodes are not limited
+governor = None
+
+# file size estimates are logged once per process
+estimate_logged = False
+
+
+def set_decode_memory(budget: int):
+    """
+    Limit the estimated memory of concurrent decodes
+    :param budget: bytes, 0 disables
+    """
+    global governor
+    governor = DecodeGovernor(budget) if budget > 0 else None
+    if governor:
+        logging.info(f"decode memory budget: {budget / MB:.0f} MB")
+
+
+def get_decode_kind(content_type: str) -> str:
+    from image_ranking.content_type import is_raw_image_file
+    if is_raw_image_file(content_type):
+        return 'raw'
+    return 'heic' if content_type == 'image/heic' else 'image'
+
+
+def get_jpeg_size(source) -> tuple | None:
+    """
+    JPEG dimensions from the start of frame header, the markers before it are skipped by their length
+    :param source: file path or binary stream
+    :return: tuple(width, height), None if not a JPEG or no frame header was found
+    """
+    with open(source, 'rb') if isinstance(source, str) else nullcontext(source) as f:
+        if f.read(2) != b'\xff\xd8':
+            return None
+        while True:
+            if f.read(1) != b'\xff':
+                return None
+
+            # skip fill bytes
+            marker = f.read(1)
+            while marker == b'\xff':
+                marker = f.read(1)
+            if not marker or marker[0] in (0xD9, 0xDA):
+                return None
+
+            # standalone markers have no length
+            if marker[0] == 0x01 or 0xD0 <= marker[0] <= 0xD7:
+                continue
+            length = f.read(2)
+            if len(length) < 2:
+                return None
+
+            # precision, height, width
+            if marker[0] in JPEG_SOF_MARKERS:
+                header = f.read(5)
+                if len(header) < 5:
+                    return None
+                return int.from_bytes(header[3:5], 'big'), int.from_bytes(header[1:3], 'big')
+            f.seek(int.from_bytes(length, 'big') - 2, os.SEEK_CUR)
+
+
+def get_image_size(path: str, kind: str, data: bytes = None, resize: tuple = None) -> tuple | None:
+    """
+    Dimensions of the image a decode produces, from the file header without decoding
+    :param resize: decode target size, selects the embedded heic thumbnail
+    :return: tuple(width, height), None if unknown
+    """
+    try:
+        source = io.BytesIO(data) if data is not None else path
+
+        # libraw reads the raw dimensions when opening, the raw data is unpacked on postprocess
+        if kind == 'raw':
+            import rawpy
+            with rawpy.imread(source) as raw:
+                sizes = raw.sizes
+            return max(sizes.raw_width, sizes.width), max(sizes.raw_height, sizes.height)
+
+        # container header only, the primary image or the thumbnail that will be decoded
+        if kind == 'heic':
+            import pillow_heif
+            from image_ranking.cv2_image_hash import cv2_heic_source
+            image, target = cv2_heic_source(pillow_heif.open_heif(source), resize)
+            return image.size
+
+        # jpeg frame header, other formats through Pillow if it is installed
+        size = get_jpeg_size(source)
+        if size is not None:
+            return size
+        if not isinstance(source, str):
+            source.seek(0)
+        from PIL import Image
+        with Image.open(source) as image:
+            return image.size
+
+    except Exception:
+        return None
+
+
+def get_decode_footprint(path: str, content_type: str, data: bytes = None, resize: tuple = None) -> int:
+    """
+    Estimated peak memory of decoding a file
+    :param resize: decode target size
+    :return: bytes
+    """
+    kind = get_decode_kind(content_type)
+    size = get_image_size(path, kind, data, resize)
+    if size is not None:
+        pixels = size[0] * size[1]
+    else:
+        length = len(data) if data is not None else os.path.getsize(path)
+        pixels = length * PIXELS_PER_BYTE[kind]
+        stats_add("decode_footprint_estimated")
+        global estimate_logged
+        if not estimate_logged:
+            estimate_logged = True
+            logging.warning(f"decode memory: no dimensions in the header of {path}, footprint estimated "
+                            f"from the file size (logged once, counted as decode_footprint_estimated)")
+    return pixels * BYTES_PER_PIXEL[kind]
+
+
+@contextmanager
+def admit(path: str, content_type: str, data: bytes = None, resize: tuple = None):
+    # hold the decode's estimated footprint while it runs
+    size = get_decode_footprint(path, content_type, data, resize)
+    current = governor
+    current.acquire(size)
+    try:
+        yield
+    finally:
+        current.release(size)
+
+
+def decode_admission(path: str, content_type: str, data=None, resize: tuple = None):
+    # admission for file and byte decodes when a budget is set
+    if governor is None or not (data is None or isinstance(data, (bytes, bytearray, memoryview))):
+        return nullcontext()
+    return admit(path, content_type, data, resize)
+
+
+def get_peak_rss() -> int | None:
+    # peak resident set size of the process in bytes, None if not available
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def report_decode_memory():
+    # budget use and peak rss in the run stats
+    if governor is None:
+        return
+    stats_set("decode_budget_peak_mb", round(governor.peak / MB))
+    peak = get_peak_rss()
+    if peak is not None:
+        stats_set("peak_rss_mb", round(peak / MB))
@@ -0,0 +1,31 @@
+import sys
+import logging
+import sysconfig
+
+
+def is_free_threaded_build() -> bool:
+    # interpreter built without the GIL (3.13t, 3.14t)
+    return bool(sysconfig.get_config_var("Py_GIL_DISABLED"))
+
+
+def is_gil_enabled() -> bool:
+    # extension modules without free-threading support re-enable the GIL on import
+    check = getattr(sys, '_is_gil_enabled', None)
+    return check() if check is not None else True
+
+
+def log_gil_status():
+    """
+    Log whether worker threads ran in parallel, called after the run so the
+    extension modules it imported lazily are loaded, warn if one of them
+    re-enabled the GIL of a free-threaded build
+    """
+    if not is_free_threaded_build():
+        logging.debug(f"python {sys.version.split()[0]}, GIL enabled")
+        return
+
+    if is_gil_enabled():
+        logging.warning(f"python {sys.version.split()[0]} free-threaded build, but the GIL was re-enabled by "
+                        f"an extension module (e.g. OpenCV), worker threads did not run in parallel")
+    else:
+        logging.info(f"python {sys.version.split()[0]} free-threaded, GIL disabled")
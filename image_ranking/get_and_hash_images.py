@@ -1,158 +1,260 @@
-import os
-import argparse
-import logging
-from tqdm import tqdm
-
-from concurrent.futures import ThreadPoolExecutor
-
-from image_ranking.image_hash import ImageHash
-
-def get_and_hash_images(args: argparse.Namespace):
-    """
-    Iterate all files in given directory, generate image hash for each image file
-    :param args: arguments namespace
-    :return: images
-    :rtype: a list of tuple(filename, file_path)
-    """
-    logging.info("get images")
-
-    images = []
-    files = os.listdir(args.directory)
-    files = [(file, args) for file in files]
-
-    # Iterate results to trim invalid files
-    images = enumerate_list(verify_file, files, args.threads)
-
-    # limit to 2x limit to account for raw/jpg pairs
-    images = limit_list(images, args.limit * 2)
-
-    # Check for matching raw/jpg pairs and remove raw if jpg exists
-    # ( raw can take 10x time to process )
-    images = get_filtered_list(images)
-
-    # limit to final limit
-    images = limit_list(images, args.limit)
-
-    # initialize valid images
-    logging.info("initialize images")
-    images = enumerate_list(initialize_file, images, args.threads)
-
-    # return images
-    return images
-
-
-def limit_list(array: list, limit: int) -> list:
-    if limit > 0 and len(array) > limit:
-        return array[:limit]
-    return array
-
-
-def enumerate_list(operation: callable, array: list, threads: int) -> list:
-    result = []
-    if len(array) > 0:
-        with ThreadPoolExecutor(max_workers=threads) as executor:
-            result = list(tqdm(executor.map(operation, array), total=len(array), ascii=' ='))
-    return list(filter(None, result))
-
-
-def get_filtered_list(array: list) -> list:
-
-    # iterate all images
-    i = 0
-    for item in array:
-
-        # if valid image
-        if item:
-
-            # get current file part
-            current = item[1]
-            image = item[0]
-
-            # get next and previous file parts
-            next = ""
-            if i < len(array):
-                next = array[i + 1]
-                if next: next = next[1]
-            prev = ""
-            if i > 1:
-                prev = array[i - 1]
-                if prev: prev = prev[1]
-
-            # check if next or previous file is same name ( different extension )
-            next = next == current
-            prev = prev == current
-
-            # if next or previous file is same name
-            if next or prev:
-
-                # check created time delta
-                if next:
-                    delta = get_created_delta(image, array[i + 1][0])
-                else:
-                    delta = get_created_delta(image, array[i - 1][0])
-
-                # if created time delta is within 3 seconds, remove raw file
-                # ( to avoid removing unrelated files with same name )
-                if delta <= 3:
-
-                    # remove current raw file
-                    if image.raw_image:
-                        logging.debug(f"Removing raw file due to existing jpeg: {image.path}")
-                        array[i] = None
-
-                    # remove next raw file
-                    elif next:
-                        logging.debug(f"Removing raw file due to existing jpeg: {array[i + 1][0].path}")
-                        array[i + 1] = None
-
-                    # remove previous raw file
-                    else:
-                        logging.debug(f"Removing raw file due to existing jpeg: {array[i - 1][0].path}")
-                        array[i - 1] = None
-
-        # invalid image
-        else:
-            array[i] = None
-
-        # increment index
-        i += 1
-
-    # return filtered list
-    return list(filter(None, array))
-
-
-def get_created_delta(image_a: ImageHash, image_b: ImageHash) -> float:
-    return abs(image_a.created - image_b.created)
-
-
-def verify_file(arguments) -> bool:
-    file, args = arguments
-
-    # Ignore xmp files
-    if file.lower().endswith('.xmp'):
-        return None
-
-    # create image hash object
-    image = ImageHash(file, args)
-    if image.validate():
-        return (image, get_file_part(file))
-
-    # invalid image
-    return None
-
-
-def get_file_part(path: str) -> str:
-    return os.path.splitext(path)[0].lower()
-
-
-def initialize_file(arguments) -> ImageHash | None:
-    image, file_part = arguments
-
-    try:
-        logging.debug(f"  {image.filename}, type: {image.content_type}")
-        image.initialize()
-        return image
-
-    except Exception as e:
-        logging.error(f"Error initializing image: {e}")
+import os
+import copy
+import argparse
+import logging
+
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from image_ranking.image_hash import ImageHash
+from image_ranking.read_ahead import ReadAhead
+from image_ranking.progress import progress
+
+def get_and_hash_images(args: argparse.Namespace, executor: ThreadPoolExecutor = None, cache=None, journal=None):
+    """
+    Iterate all files in given directory, generate image hash for each image file
+    :param args: arguments namespace
+    :param executor: shared worker pool, a pool per stage is created if None
+    :param cache: image cache, restores images hashed by a previous run
+    :param journal: run journal, a resumed run keeps the interrupted run's listing
+    :return: images
+    :rtype: a list of tuple(filename, file_path)
+    """
+    images = get_images(args, executor, journal)
+    if journal is not None:
+        journal.start(images)
+
+    # byte identical copies skip processing and inherit the original's results
+    if args.duplicates in ('skip', 'report'):
+        from image_ranking.image_duplicates import find_duplicates, report_duplicates
+        images, duplicates = find_duplicates(
+            images, lambda operation, array: enumerate_list(operation, array, args.threads, executor))
+
+        # only report duplicates
+        if args.duplicates == 'report':
+            report_duplicates(duplicates)
+            return []
+
+        for duplicate, original in duplicates:
+            original.duplicates.append(duplicate)
+
+    # similarity image arena
+    arena = None
+    if args.arena or args.arena_file:
+        from image_ranking.image_arena import create_arena
+        arena = create_arena([item[0] for item in images], args)
+
+    # the cache restores similarity images, the journal only the hashes of finished groups
+    images = hash_images(images, args, executor, cache if cache is not None else journal)
+
+    # persist arena for the next run
+    if arena is not None:
+        from image_ranking.image_arena import save_arena
+        save_arena(arena, images)
+
+    return images
+
+
+def get_images(args: argparse.Namespace, executor: ThreadPoolExecutor = None, journal=None) -> list:
+    """
+    Iterate all files in given directory, validate and filter image files
+    :param args: arguments namespace
+    :param executor: shared worker pool
+    :param journal: run journal, a resumed run uses the interrupted run's listing
+    :return: images
+    :rtype: a list of tuple(image, file_part)
+    """
+    logging.info("get images")
+
+    images = []
+    files = sorted(os.listdir(args.directory))
+
+    # resumed run, xmp files written before the interruption must not exclude images
+    if journal is not None and journal.files is not None:
+        files = journal.files
+        args = copy.copy(args)
+        args.exclude = False
+    files = [(file, args) for file in files]
+
+    # Iterate results to trim invalid files
+    images = enumerate_list(verify_file, files, args.threads, executor)
+
+    # limit to 2x limit to account for raw/jpg pairs
+    images = limit_list(images, args.limit * 2)
+
+    # Check for matching raw/jpg pairs and remove raw if jpg exists
+    # ( raw can take 10x time to process )
+    images = get_filtered_list(images)
+
+    # limit to final limit
+    return limit_list(images, args.limit)
+
+
+def hash_images(images: list, args: argparse.Namespace, executor: ThreadPoolExecutor = None, cache=None) -> list:
+    """
+    Initialize (exif, similarity image, hash) validated images
+    :param images: a list of tuple(image, file_part)
+    :param args: arguments namespace
+    :param executor: shared worker pool
+    :param cache: image cache or run journal
+    :return: initialized images
+    """
+    logging.info("initialize images")
+
+    # restore cached images
+    cached = set()
+    if cache is not None:
+        cached = {id(item[0]) for item in images if cache.restore(item[0], "initialize")}
+
+    # initialize remaining images
+    initialized = enumerate_read_ahead(
+        initialize_file,
+        [item for item in images if id(item[0]) not in cached],
+        lambda item: item[0].path, args, "initialize", executor)
+    if cache is not None:
+        for image in initialized:
+            cache.store(image, "initialize")
+
+    # keep capture order
+    valid = cached | {id(image) for image in initialized}
+    return [item[0] for item in images if id(item[0]) in valid]
+
+
+def limit_list(array: list, limit: int) -> list:
+    if limit > 0 and len(array) > limit:
+        return array[:limit]
+    return array
+
+
+def enumerate_list(operation: callable, array: list, threads: int, executor: ThreadPoolExecutor = None) -> list:
+    result = []
+    if len(array) > 0:
+        if executor is not None:
+            result = list(progress(executor.map(operation, array), total=len(array)))
+        else:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                result = list(progress(executor.map(operation, array), total=len(array)))
+    return list(filter(None, result))
+
+
+def enumerate_read_ahead(operation: callable, array: list, get_path: callable,
+                         args: argparse.Namespace, stage: str, executor: ThreadPoolExecutor = None) -> list:
+    """
+    Apply operation(item, data) to every item, prefetching file bytes when
+    read-ahead is enabled, otherwise data is None and the file is read by operation
+    """
+    result = []
+    if len(array) > 0:
+        if args.read_ahead > 0:
+            read_ahead = ReadAhead(args.io_threads, args.threads, args.read_ahead)
+            result = read_ahead.map(operation, array, get_path, stage, executor)
+        else:
+            result = enumerate_list(partial(operation, data=None), array, args.threads, executor)
+    return list(filter(None, result))
+
+
+def get_filtered_list(array: list) -> list:
+
+    # iterate all images
+    i = 0
+    for item in array:
+
+        # if valid image
+        if item:
+
+            # get current file part
+            current = item[1]
+            image = item[0]
+
+            # get next and previous file parts
+            next = ""
+            if i + 1 < len(array):
+                next = array[i + 1]
+                if next: next = next[1]
+            prev = ""
+            if i > 1:
+                prev = array[i - 1]
+                if prev: prev = prev[1]
+
+            # check if next or previous file is same name ( different extension )
+            next = next == current
+            prev = prev == current
+
+            # if next or previous file is same name
+            if next or prev:
+
+                # check created time delta
+                if next:
+                    delta = get_created_delta(image, array[i + 1][0])
+                else:
+                    delta = get_created_delta(image, array[i - 1][0])
+
+                # if created time delta is within 3 seconds, remove raw file
+                # ( to avoid removing unrelated files with same name )
+                if delta <= 3:
+
+                    # remove current raw file
+                    if image.raw_image:
+                        logging.debug(f"Removing raw file due to existing jpeg: {image.path}")
+                        array[i] = None
+
+                    # remove next raw file
+                    elif next:
+                        logging.debug(f"Removing raw file due to existing jpeg: {array[i + 1][0].path}")
+                        array[i + 1] = None
+
+                    # remove previous raw file
+                    else:
+                        logging.debug(f"Removing raw file due to existing jpeg: {array[i - 1][0].path}")
+                        array[i - 1] = None
+
+        # invalid image
+        else:
+            array[i] = None
+
+        # increment index
+        i += 1
+
+    # return filtered list
+    return list(filter(None, array))
+
+
+def get_created_delta(image_a: ImageHash, image_b: ImageHash) -> float:
+    return abs(image_a.created - image_b.created)
+
+
+def verify_file(arguments) -> bool:
+    file, args = arguments
+
+    # Ignore xmp files
+    if file.lower().endswith('.xmp'):
+        return None
+
+    # Ignore directories, e.g. profile output and shard results
+    if os.path.isdir(os.path.join(args.directory, file)):
+        return None
+
+    # create image hash object
+    image = ImageHash(file, args)
+    if image.validate():
+        return (image, get_file_part(file))
+
+    # invalid image
+    return None
+
+
+def get_file_part(path: str) -> str:
+    return os.path.splitext(path)[0].lower()
+
+
+def initialize_file(arguments, data: bytes = None) -> ImageHash | None:
+    image, file_part = arguments
+
+    try:
+        logging.debug(f"  {image.filename}, type: {image.content_type}")
+        image.initialize(data)
+        return image
+
+    except Exception as e:
+        logging.error(f"Error initializing image: {e}")
         return None
\ No newline at end of file
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import logging
+import weakref
+import numpy as np
+
+from multiprocessing import shared_memory
+
+
+class ImageArena:
+
+    """
+    Contiguous (N, H, W) uint8 block holding all similarity images, backed by
+    shared memory or a memory mapped .npy file. Images hold a slot index and
+    read zero-copy views, the arena pickles by name so process pool workers
+    attach to the same memory.
+    :param count: number of slots
+    :param shape: (height, width) of each slot
+    :param path: .npy file to memory map, shared memory is used if None
+    """
+    def __init__(self, count: int, shape: tuple, path: str = None):
+        self.shape = (count, *shape)
+        self.path = path
+        self.shm = None
+
+        # persisted index, written once the slots are filled
+        self.index = None
+
+        # memory mapped file
+        if path is not None:
+            self.array = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=self.shape)
+
+        # shared memory, unlinked when the arena is collected
+        else:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(self.shape))))
+            self.array = np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf)
+            weakref.finalize(self, self.shm.unlink)
+
+
+    @classmethod
+    def load(cls, path: str):
+        # memory map existing arena file
+        arena = cls.__new__(cls)
+        arena.path = path
+        arena.shm = None
+        arena.index = None
+        arena.array = np.load(path, mmap_mode='r+')
+        arena.shape = arena.array.shape
+        return arena
+
+
+    def __getstate__(self):
+        return {'shape': self.shape, 'path': self.path, 'name': self.shm.name if self.shm else None}
+
+
+    def __setstate__(self, state):
+        self.shape = state['shape']
+        self.path = state['path']
+        self.shm = None
+        self.index = None
+
+        # attach to the creator's memory
+        if self.path is not None:
+            self.array = np.load(self.path, mmap_mode='r+')
+        else:
+            self.shm = attach_shared_memory(state['name'])
+            self.array = np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf)
+
+
+    def __getitem__(self, index: int):
+        return self.array[index]
+
+
+    def __setitem__(self, index: int, image):
+        if image.shape != self.shape[1:]:
+            raise ValueError(f"image shape {image.shape} does not match arena slot {self.shape[1:]}")
+        np.copyto(self.array[index], image)
+
+
+    def flush(self):
+        if isinstance(self.array, np.memmap):
+            self.array.flush()
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(name=name)
+
+    # attached memory is owned by the creator, stop the tracker from unlinking it
+    if sys.version_info < (3, 13):
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def get_arena_index(images: list, args) -> dict:
+    # files and options the persisted arena was built from
+    from image_ranking.image_cache import CACHE_STAGES
+    fields, options = CACHE_STAGES['initialize']
+    files = []
+    for image in images:
+        stat = os.stat(image.path)
+        files.append([image.filename, stat.st_size, stat.st_mtime_ns])
+    return {
+        'files': files,
+        'options': repr(tuple(getattr(args, option, None) for option in options)),
+    }
+
+
+def create_arena(images: list, args) -> ImageArena | None:
+    """
+    Create arena for validated images and assign each image a slot, reuses
+    the persisted arena file if it was built from the same files and options
+    :param images: validated images
+    :param args: arguments namespace
+    :return: arena, None if the similarity image size depends on the source
+    """
+    from image_ranking.cv2_image_hash import cv2_processed_shape
+    shape = cv2_processed_shape(args)
+    if shape is None or len(images) == 0:
+        logging.debug("arena disabled, similarity resize is not a fixed size")
+        return None
+
+    arena = None
+    initialized = [False] * len(images)
+
+    # arena file next to the images
+    if args.arena_file:
+        path = os.path.join(args.directory, '.image-ranking-arena.npy')
+        index = get_arena_index(images, args)
+
+        # reuse persisted arena
+        try:
+            with open(f"{path}.json", 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved['files'] == index['files'] and saved['options'] == index['options']:
+                arena = ImageArena.load(path)
+                if arena.shape == (len(images), *shape):
+                    initialized = saved['initialized']
+                    arena.index = index
+                    logging.info(f"arena loaded from {path}")
+                else:
+                    arena = None
+        except (OSError, ValueError, KeyError):
+            arena = None
+
+        # new arena file
+        if arena is None:
+            arena = ImageArena(len(images), shape, path)
+            arena.index = index
+
+    # shared memory arena
+    else:
+        arena = ImageArena(len(images), shape)
+
+    # assign slots
+    for i, image in enumerate(images):
+        image.arena = arena
+        image.arena_index = i
+        image.arena_loaded = initialized[i]
+
+    return arena
+
+
+def save_arena(arena: ImageArena, images: list):
+    """
+    Flush arena file and write its index for the next run
+    :param arena: arena
+    :param images: successfully initialized images
+    """
+    if arena.index is None:
+        return
+    arena.flush()
+
+    # mark filled slots
+    filled = {image.arena_index for image in images}
+    arena.index['initialized'] = [i in filled for i in range(arena.shape[0])]
+    with open(f"{arena.path}.json", 'w', encoding='utf-8') as f:
+        json.dump(arena.index, f)
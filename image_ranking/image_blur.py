@@ -4,27 +4,29 @@ import numpy
 
 from image_ranking.cv2_image_hash import (
     cv2_get_image,
+    cv2_get_scaled_jpeg,
     cv2_crop,
-    cv2_resize
+    cv2_window
 )
 
+# scaled decode fallback is logged once per process
+scaled_fallback_logged = False
+
 def calculate_blur(
         filename: str,
         content_type: str,
         mode: str = "sml",
         resize: tuple = None,
-        crop: float = 0.0) -> float:
+        crop: float = 0.0,
+        data: bytes = None,
+        window: tuple = None,
+        scaled: bool = False) -> float:
 
-    # read image
-    image = cv2_get_image(filename, content_type, True)
+    # read and crop image
+    image = get_blur_image(filename, content_type, resize, crop, data, window, scaled)
     if image is None:
-        logging.warning(f'warning! failed to read image from {filename}; skipping!')
         return
 
-    # resize and crop
-    image = cv2_resize(image, resize) # resize to speed up processing
-    image = cv2_crop(image, crop) # crop for central blur detection
-
     # estimate blur
     mode = str(mode).lower()
     match mode:
@@ -45,6 +47,43 @@ def calculate_blur(
 
     return score
 
+def get_blur_image(
+        filename: str,
+        content_type: str,
+        resize: tuple = None,
+        crop: float = 0.0,
+        data: bytes = None,
+        window: tuple = None,
+        scaled: bool = False) -> numpy.array:
+
+    # read image, focus windows are cut from the full resolution
+    if window is not None:
+        resize = None
+    image = None
+
+    # JPEG decoded at the resize scale instead of full size and resized
+    if scaled and window is None:
+        image = cv2_get_scaled_jpeg(filename, content_type, data, resize)
+        if image is None:
+            global scaled_fallback_logged
+            if not scaled_fallback_logged:
+                scaled_fallback_logged = True
+                logging.warning(f"blur_scaled_decode: decoding {filename} at full size, only JPEG files with a "
+                                f"half or quarter blur resize are decoded scaled (logged once)")
+
+    if image is None:
+        image = cv2_get_image(filename, content_type, True, data, resize) # resize to speed up processing
+    if image is None:
+        logging.warning(f'warning! failed to read image from {filename}; skipping!')
+        return
+
+    # window (x, y, size) around the focus point
+    if window is not None:
+        return cv2_window(image, window[:2], window[2])
+
+    # crop
+    return cv2_crop(image, crop) # crop for central blur detection
+
 def calculate_laplacian(image: numpy.array):
 
     # Laplacian
@@ -69,4 +108,122 @@ def calculate_sml(image: numpy.array):
     M = numpy.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]])
     score = numpy.abs(cv2.filter2D(image, cv2.CV_64F, M)).sum()
 
-    return score
\ No newline at end of file
+    return score
+
+def get_blur_map(image: numpy.array, mode: str) -> numpy.array:
+
+    # per pixel values the pixel mode scores are sums or means of
+    match mode:
+        case "laplacian":
+            return cv2.Laplacian(image, cv2.CV_64F)
+        case "sobel":
+            sobelx = cv2.Sobel(image, cv2.CV_64F, 1, 0, ksize=3)
+            sobely = cv2.Sobel(image, cv2.CV_64F, 0, 1, ksize=3)
+            return numpy.sqrt(sobelx**2 + sobely**2)
+        case _:
+            M = numpy.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]])
+            return numpy.abs(cv2.filter2D(image, cv2.CV_64F, M))
+
+class BlurSamples:
+
+    """
+    Tiles of one frame scored so far, tiles are filtered with a one pixel
+    halo so the sum over all tiles equals the full image score
+    :param image: cropped grayscale image
+    :param mode: blur mode
+    :param tile: tile size in pixels
+    :param seed: tile order seed, frames of a group share it so they sample the same regions
+    """
+    def __init__(self, image: numpy.array, mode: str, tile: int, seed: int = 0):
+        self.image = image
+        self.mode = mode
+        height, width = image.shape[:2]
+        self.tiles = [(y, x) for y in range(0, height, tile) for x in range(0, width, tile)]
+        numpy.random.default_rng(seed).shuffle(self.tiles)
+        self.tile = tile
+        self.count = height * width
+        self.scored = 0
+        self.pixels = 0
+
+        # per tile pixel count, sum and sum of squares of the blur map
+        self.n = []
+        self.sum = []
+        self.squares = []
+
+    @property
+    def done(self) -> bool:
+        return self.scored == len(self.tiles)
+
+    def refine(self, tiles: int):
+        height, width = self.image.shape[:2]
+        for y, x in self.tiles[self.scored:self.scored + tiles]:
+            top, left = max(0, y - 1), max(0, x - 1)
+            bottom, right = min(height, y + self.tile + 1), min(width, x + self.tile + 1)
+            values = get_blur_map(self.image[top:bottom, left:right], self.mode)
+            values = values[y - top:y - top + self.tile, x - left:x - left + self.tile]
+            self.n.append(values.size)
+            self.sum.append(values.sum())
+            self.squares.append((values ** 2).sum() if self.mode == "laplacian" else 0)
+            self.pixels += (bottom - top) * (right - left)
+        self.scored = min(len(self.tiles), self.scored + tiles)
+
+    def estimate(self) -> tuple:
+        # score estimate of the full crop and its standard error, exact once every tile is scored
+        n, sums, squares = numpy.array(self.n), numpy.array(self.sum), numpy.array(self.squares)
+        mean = sums.sum() / n.sum()
+        match self.mode:
+            case "laplacian":
+                score = squares.sum() / n.sum() - mean ** 2
+                values = squares / n - mean ** 2
+            case "sobel":
+                score = mean
+                values = sums / n
+            case _:
+                score = mean * self.count
+                values = sums / n * self.count
+        if self.done or len(values) < 2:
+            return float(score), 0.0 if self.done else float('inf')
+
+        # sampling without replacement from the tiles
+        error = values.std(ddof=1) / numpy.sqrt(len(values)) * numpy.sqrt(1 - len(values) / len(self.tiles))
+        return float(score), float(error)
+
+def rank_blur_progressive(
+        images: list,
+        ranks: list,
+        mode: str = "sml",
+        tolerance: float = 0.05,
+        tile: int = 128,
+        rounds: int = 16) -> tuple:
+
+    # progressive blur of a group, frames are scored on sampled tiles in rounds until
+    # their confidence intervals separate at every rank boundary, frames that are
+    # too close to call are refined up to the full crop
+    from statistics import NormalDist
+    z = NormalDist().inv_cdf(1 - tolerance / 2)
+    samples = [BlurSamples(image, str(mode).lower(), tile) for image in images]
+    boundaries = [k for k in range(1, len(ranks)) if ranks[k] != ranks[k - 1]]
+
+    active = list(range(len(samples)))
+    while active:
+        for i in active:
+            samples[i].refine(max(2, -(-len(samples[i].tiles) // rounds)))
+
+        # confidence intervals in score order
+        estimates = [item.estimate() for item in samples]
+        low = [score - z * error for score, error in estimates]
+        high = [score + z * error for score, error in estimates]
+        order = sorted(range(len(samples)), key=lambda i: estimates[i][0], reverse=True)
+
+        # frames whose intervals overlap across a boundary
+        contested = set()
+        for k in boundaries:
+            top, rest = order[:k], order[k:]
+            bound_low, bound_high = min(low[i] for i in top), max(high[i] for i in rest)
+            if bound_low <= bound_high:
+                contested.update(i for i in top if low[i] <= bound_high)
+                contested.update(i for i in rest if high[i] >= bound_low)
+        active = [i for i in sorted(contested) if not samples[i].done]
+
+    scores = [estimate[0] for estimate in estimates] if samples else []
+    return scores, [item.pixels for item in samples], [item.count for item in samples]
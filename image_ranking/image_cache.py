@@ -0,0 +1,79 @@
+import os
+import threading
+
+from collections import OrderedDict
+
+
+# per stage image fields and the options they depend on
+CACHE_STAGES = {
+    'initialize': (
+        ('exif', 'processed_image', 'shape', 'hash', 'metric', 'thumbnail'),
+        ('feature_matching', 'diff', 'cascade_band', 'similarity_resize', 'similarity_crop',
+         'similarity_blur')),
+    'blur': (
+        ('blur',),
+        ('blur_mode', 'blur_resize', 'blur_crop', 'blur_window', 'blur_tolerance', 'blur_scaled_decode')),
+}
+
+
+class ImageCache:
+
+    """
+    Thread safe LRU cache of per image stage outputs, keyed on the file
+    identity (path, size, mtime) and the options the stage depends on
+    :param max_entries: max cached stage outputs
+    """
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def key(self, image, stage: str) -> tuple | None:
+        fields, options = CACHE_STAGES[stage]
+        try:
+            stat = os.stat(image.path)
+        except OSError:
+            return None
+        return (stage, image.path, stat.st_size, stat.st_mtime_ns,
+                repr(tuple(getattr(image.args, option, None) for option in options)))
+
+
+    def restore(self, image, stage: str) -> bool:
+        """
+        Restore cached stage output into image
+        :return: True if found
+        """
+        key = self.key(image, stage)
+        with self.lock:
+            values = self.entries.get(key) if key else None
+            if values is None:
+                self.misses += 1
+                return False
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        for name, value in values.items():
+            setattr(image, name, value)
+        return True
+
+
+    def store(self, image, stage: str):
+        key = self.key(image, stage)
+        if key is None:
+            return
+
+        fields, options = CACHE_STAGES[stage]
+        values = {name: getattr(image, name, None) for name in fields}
+
+        # copy arena views, the arena may be released before the cache
+        for name, value in values.items():
+            if getattr(value, 'base', None) is not None and hasattr(value, 'copy'):
+                values[name] = value.copy()
+        with self.lock:
+            self.entries[key] = values
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
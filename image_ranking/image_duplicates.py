@@ -0,0 +1,81 @@
+import os
+import hashlib
+import logging
+
+from image_ranking.stats import stats_add
+
+# bytes hashed for the partial hash
+PARTIAL_HASH_SIZE = 64 * 1024
+
+# read size for the full hash
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_file_hash(path: str, limit: int = None) -> str:
+    # hash the whole file, or its first limit bytes
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        remaining = limit
+        while remaining is None or remaining > 0:
+            chunk = f.read(HASH_CHUNK_SIZE if remaining is None else min(remaining, HASH_CHUNK_SIZE))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def find_duplicates(images: list, map_list: callable) -> tuple:
+    """
+    Find byte identical files, bucketed by size, then partial hash, then full hash
+    :param images: a list of tuple(image, file_part) in capture order
+    :param map_list: parallel map, callable(operation, array) -> list
+    :return: tuple(unique images, a list of tuple(duplicate image, original image))
+    """
+
+    # bucket by size, only same size files can be identical
+    buckets = {}
+    for item in images:
+        buckets.setdefault(os.path.getsize(item[0].path), []).append(item)
+    candidates = [item for bucket in buckets.values() if len(bucket) > 1 for item in bucket]
+
+    # narrow down by partial hash, then full hash
+    for limit in (PARTIAL_HASH_SIZE, None):
+        def hash_file(item) -> tuple:
+            return item, get_file_hash(item[0].path, limit)
+
+        hashes = map_list(hash_file, candidates)
+        buckets = {}
+        for item, file_hash in hashes:
+            buckets.setdefault((os.path.getsize(item[0].path), file_hash), []).append(item)
+        candidates = [item for bucket in buckets.values() if len(bucket) > 1 for item in bucket]
+
+    # first copy in capture order is the original
+    duplicates = []
+    duplicate_ids = set()
+    for bucket in buckets.values():
+        if len(bucket) < 2:
+            continue
+        original = bucket[0][0]
+        for item in bucket[1:]:
+            duplicates.append((item[0], original))
+            duplicate_ids.add(id(item[0]))
+            stats_add("duplicates")
+            stats_add("duplicate_bytes", os.path.getsize(item[0].path))
+            logging.debug(f"duplicate: {item[0].filename} of {original.filename}")
+
+    unique = [item for item in images if id(item[0]) not in duplicate_ids]
+    return unique, duplicates
+
+
+def report_duplicates(duplicates: list):
+    # log duplicates grouped by original
+    originals = {}
+    for duplicate, original in duplicates:
+        originals.setdefault(original.filename, []).append(duplicate.filename)
+
+    message = f"{len(duplicates)} duplicate(s) of {len(originals)} file(s)"
+    for original, copies in originals.items():
+        message += f"\n  {original}: {', '.join(copies)}"
+    logging.info(message)
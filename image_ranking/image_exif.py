@@ -1,32 +1,156 @@
-import exifread
-import logging
-
-def get_exif(path: str) -> dict:
-    # get exif data
-    with open(path, 'rb') as f:
-        return exifread.process_file(f, debug=True, stop_tag="MakerNote NoteVersion", extract_thumbnail=False)
-
-    #interesting exif tags:
-    #BlurWarning - not sure what these values show
-    #FocusWarning
-    #ExposureWarning
-    #FocusMode
-    #AFPointSet - could use these to target blur detection?
-    #FocusPixel
-
-def exif_match(exif_a, exif_b) -> bool:
-    def get_camera_lens_exif(exif) -> tuple:
-        return (
-            str(exif.get('Image Make', None)),
-            str(exif.get('Image Model', None)),
-            str(exif.get('EXIF LensMake', None)),
-            str(exif.get('EXIF LensModel', None))
-        )
-
-    a = get_camera_lens_exif(exif_a)
-    b = get_camera_lens_exif(exif_b)
-
-    invalid = all(element == 'None' for element in a)
-    invalid = invalid and all(element == 'None' for element in b)
-
-    return (a == b) or invalid
\ No newline at end of file
+import io
+import exifread
+import logging
+from datetime import datetime
+
+# drive mode sequence / burst counters, 0 is a single shot
+# (Canon, Sony: SequenceNumber, Fuji: SequenceNumber is not named by exifread, Olympus: Sequence shot number)
+SEQUENCE_TAGS = (
+    'MakerNote SequenceNumber',
+    'MakerNote Tag 0x1101',
+    'MakerNote Sequence',
+)
+
+# focus point tags and their layout
+# (Fuji FocusPixel, EXIF SubjectArea / SubjectLocation: x, y in pixels of the exif image size,
+# Sony FocusLocation is not named by exifread: width, height, x, y, Nikon AFFocusPosition: coarse position)
+FOCUS_TAGS = (
+    ('MakerNote FocusPixel', 'point'),
+    ('MakerNote Tag 0x2027', 'sized'),
+    ('EXIF SubjectArea', 'point'),
+    ('EXIF SubjectLocation', 'point'),
+    ('MakerNote AFFocusPosition', 'position'),
+)
+
+# coarse focus positions as fractions of the image
+FOCUS_POSITIONS = {
+    'Center': (0.5, 0.5),
+    'Top': (0.5, 0.25),
+    'Bottom': (0.5, 0.75),
+    'Left': (0.25, 0.5),
+    'Right': (0.75, 0.5),
+}
+
+# fractional point in the stored image to the decoded image, by exif orientation
+ORIENTATIONS = {
+    2: lambda x, y: (1 - x, y),
+    3: lambda x, y: (1 - x, 1 - y),
+    4: lambda x, y: (x, 1 - y),
+    5: lambda x, y: (y, x),
+    6: lambda x, y: (1 - y, x),
+    7: lambda x, y: (1 - y, 1 - x),
+    8: lambda x, y: (y, 1 - x),
+}
+
+def get_exif(path: str, data: bytes = None) -> dict:
+    # get exif data, from prefetched bytes if available
+    with (io.BytesIO(data) if data is not None else open(path, 'rb')) as f:
+        return exifread.process_file(f, debug=True, stop_tag="MakerNote NoteVersion", extract_thumbnail=False)
+
+    #interesting exif tags:
+    #BlurWarning - not sure what these values show
+    #FocusWarning
+    #ExposureWarning
+    #FocusMode
+    #AFPointSet - could use these to target blur detection?
+    #FocusPixel
+
+def exif_match(exif_a, exif_b) -> bool:
+    def get_camera_lens_exif(exif) -> tuple:
+        return (
+            str(exif.get('Image Make', None)),
+            str(exif.get('Image Model', None)),
+            str(exif.get('EXIF LensMake', None)),
+            str(exif.get('EXIF LensModel', None))
+        )
+
+    a = get_camera_lens_exif(exif_a)
+    b = get_camera_lens_exif(exif_b)
+
+    invalid = all(element == 'None' for element in a)
+    invalid = invalid and all(element == 'None' for element in b)
+
+    return (a == b) or invalid
+
+def get_capture_time(exif) -> float | None:
+
+    # capture time, including sub seconds if available
+    value = exif.get('EXIF DateTimeOriginal', None)
+    if value is None:
+        return None
+    try:
+        timestamp = datetime.strptime(str(value).strip(), "%Y:%m:%d %H:%M:%S").timestamp()
+    except ValueError:
+        return None
+
+    subsec = str(exif.get('EXIF SubSecTimeOriginal', '')).strip()
+    if subsec.isdigit():
+        timestamp += float(f"0.{subsec}")
+    return timestamp
+
+def get_sequence_number(exif) -> int | None:
+
+    # first available sequence counter
+    for tag in SEQUENCE_TAGS:
+        value = exif.get(tag, None)
+        if value is None:
+            continue
+
+        # olympus stores (mode, shot number, mode bits)
+        values = getattr(value, 'values', value)
+        if isinstance(values, (list, tuple)):
+            values = values[1] if len(values) > 1 else values[0] if values else None
+        try:
+            return int(str(values))
+        except ValueError:
+            continue
+    return None
+
+def get_exif_values(exif, tag: str) -> list | None:
+
+    # numeric tag values, tags or plain overrides
+    value = exif.get(tag, None)
+    if value is None:
+        return None
+    values = getattr(value, 'values', value)
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    try:
+        return [float(v) for v in values]
+    except (TypeError, ValueError):
+        return None
+
+def get_focus_point(exif) -> tuple | None:
+
+    # focus point as (x, y) fractions of the decoded image, None without focus data
+    size = (get_exif_values(exif, 'EXIF ExifImageWidth') or [0])[0], \
+           (get_exif_values(exif, 'EXIF ExifImageLength') or [0])[0]
+    for tag, layout in FOCUS_TAGS:
+        if tag not in exif:
+            continue
+
+        # coarse position labels
+        if layout == 'position':
+            point = FOCUS_POSITIONS.get(str(exif[tag]).strip())
+            if point is None:
+                continue
+
+        # pixel coordinates, relative to the size stored with them or the exif image size
+        else:
+            values = get_exif_values(exif, tag)
+            if layout == 'sized' and values and len(values) >= 4:
+                width, height, x, y = values[:4]
+            elif layout == 'point' and values and len(values) >= 2:
+                (x, y), (width, height) = values[:2], size
+            else:
+                continue
+            if width <= 0 or height <= 0 or not (0 <= x <= width and 0 <= y <= height):
+                continue
+            point = (x / width, y / height)
+
+        # stored orientation to displayed orientation
+        orientation = get_exif_values(exif, 'Image Orientation')
+        rotate = ORIENTATIONS.get(int(orientation[0])) if orientation else None
+        return rotate(*point) if rotate else point
+
+    return None
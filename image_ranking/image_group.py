@@ -0,0 +1,52 @@
+class ImageGrouper:
+
+    """
+    Sequential image grouping, images are added in order and either join the
+    current group or start a new one. An image joins the group if it matches
+    the group anchor, or failing that the previous image, which then becomes
+    the anchor. Produces the same groups and comparisons as comparing every
+    image against the following ones until the first mismatch.
+    :param root: current group root
+    :param anchor: image new images are compared against
+    :param previous: last added image
+    :param compare: callable(a, b) -> bool, defaults to a.is_same_group(b)
+    """
+    def __init__(self, root=None, anchor=None, previous=None, compare: callable = None):
+        self.root = root
+        self.anchor = anchor
+        self.previous = previous
+        self.compare = compare or (lambda a, b: a.is_same_group(b))
+
+
+    def add(self, image) -> bool:
+        """
+        Add next image
+        :param image: image to group
+        :return: True if the image starts a new group
+        """
+
+        # compare with anchor, fall back to previous image
+        same = False
+        if self.previous is not None:
+            same = self.compare(self.anchor, image)
+            if not same and self.anchor is not self.previous:
+                same = self.compare(self.previous, image)
+                if same:
+                    self.anchor = self.previous
+
+        # join current group
+        if same:
+            image.root = self.root
+
+        # start new group
+        else:
+            self.root = image
+            self.anchor = image
+
+        self.previous = image
+        return not same
+
+
+    @property
+    def state(self) -> tuple:
+        return self.root, self.anchor, self.previous
@@ -1,154 +1,265 @@
-import hashlib
-import logging
-import os
-
-#suppress exifread warnings
-logging.getLogger("exifread").setLevel(logging.ERROR)
-
-class ImageHash:
-
-    """
-    Image data and methods for comparing images
-    :param filename: image filename
-    """
-    def __init__(self, filename: str, args):
-
-        # set args
-        self.args = args
-
-        # set filename
-        self.filename = filename
-
-        # image original path
-        self.path = os.path.join(args.directory, filename)
-
-        # image mime type
-        from image_ranking.content_type import get_mime_type
-        self.content_type = get_mime_type(self.path)
-
-        # image blur value
-        self.blur = None
-
-        # image rank
-        self.rank = 0
-
-        # similarity data
-        self.similar = []
-
-        # parent image ref
-        self.root = None
-
-
-    def validate(self) -> bool:
-
-        # Validate file exists
-        if os.path.isfile(self.path):
-
-            # Ignore already processed file
-            if self.args.exclude:
-                if os.path.isfile(f"{self.path}.xmp"):
-                    logging.debug(f"Skipping already processed file: {self.filename}")
-                    return False
-
-            # validate image file
-            from image_ranking.content_type import is_image_file
-            if not is_image_file(self.content_type):
-                logging.debug(f"Skipping non-image file: {self.filename}, type: {self.content_type}")
-                return False
-
-            # raw image flag
-            from image_ranking.content_type import is_raw_image_file
-            self.raw_image = is_raw_image_file(self.content_type)
-
-            # log file timestamp
-            self.created = os.path.getctime(self.path)
-
-            # file exists and is valid
-            return True
-
-        # file does not exist
-        logging.debug(f"File does not exist: {self.filename}")
-        return False
-
-    def initialize(self):
-
-        # get exif data
-        from image_ranking.image_exif import get_exif
-        self.exif = get_exif(self.path)
-
-        # cv2 processed image
-        from image_ranking.cv2_image_hash import cv2_process_image
-        self.processed_image = cv2_process_image(self.path, self.content_type, self.args)
-
-        # save image shape
-        self.shape = self.args.similarity_resize
-        if self.processed_image.shape is not None:
-            self.shape = self.processed_image.shape
-
-        # hash image
-        self.hash = hashlib.md5(str(self.processed_image).encode()).hexdigest()
-
-        # calculate score threshold
-        self.metric = self.args.diff
-        if not self.args.feature_matching:
-            self.metric = self.shape[0] * self.shape[1] * self.metric
-
-
-    def is_same_group(self, anotherImage) -> bool:
-
-        score = 0
-        result = False
-
-        # return if exif data mismatch
-        from image_ranking.image_exif import exif_match
-        if not exif_match(self.exif, anotherImage.exif):
-            logging.debug(f"EXIF mismatch: {self.filename} and {anotherImage.filename}")
-            return result
-
-        # feature matching
-        if self.args.feature_matching:
-            from image_ranking.image_similarity import image_similarity
-            score = image_similarity(self.processed_image, anotherImage.processed_image)
-            result = score >= self.args.diff
-
-        # cv2 hash compare
-        else:
-            from image_ranking.cv2_image_hash import cv2_compare_image
-            score, res_cnts, thresh = cv2_compare_image(
-                self.processed_image,
-                anotherImage.processed_image,
-                self.args)
-            #delta is rougly number of total pixels
-            result = score < self.metric
-
-        # save similarity data
-        self.similar.append((anotherImage.filename, score, result))
-
-        # return compare result
-        return result
-
-    def calculate_blur(self):
-        try:
-
-            # calculate blur
-            from image_ranking.image_blur import calculate_blur
-            self.blur = calculate_blur(
-                self.path,
-                self.content_type,
-                self.args.blur_mode,
-                self.args.blur_resize,
-                self.args.blur_crop)
-
-            return True
-
-        except Exception as e:
-            logging.error(f"error calculating blur for {self.path}: {e}", exc_info=True)
-
-        return False
-
-
-    @property
-    def root_hash(self) -> str:
-        # get image root hash, if self is root, get self hash
-        if not self.root: return self.hash
-        return self.root.hash
+import hashlib
+import logging
+import os
+
+from image_ranking.stats import stats_add
+
+#suppress exifread warnings
+logging.getLogger("exifread").setLevel(logging.ERROR)
+
+class ImageHash:
+
+    """
+    Image data and methods for comparing images
+    :param filename: image filename, or image id for in-memory images
+    :param data: in-memory image, encoded file bytes or decoded numpy array
+    :param metadata: exif tag overrides, e.g. {'Image Model': 'X-T5'}
+    """
+    def __init__(self, filename: str, args, data=None, metadata: dict = None):
+
+        # set args
+        self.args = args
+
+        # similarity image arena slot
+        self.arena = None
+        self.arena_index = None
+        self.arena_loaded = False
+        self._processed_image = None
+
+        # set filename
+        self.filename = filename
+
+        # in-memory image data and metadata
+        self.data = data
+        self.metadata = metadata or {}
+
+        # in-memory image, sniff type from buffer
+        if data is not None:
+            from image_ranking.content_type import get_buffer_mime_type, is_raw_image_file
+            self.path = filename
+            self.content_type = get_buffer_mime_type(data)
+            self.raw_image = is_raw_image_file(self.content_type)
+
+        # image file
+        else:
+
+            # image original path
+            self.path = os.path.join(args.directory, filename)
+
+            # image mime type
+            from image_ranking.content_type import get_mime_type
+            self.content_type = get_mime_type(self.path)
+
+        # image blur value
+        self.blur = None
+
+        # image rank
+        self.rank = 0
+
+        # similarity data
+        self.similar = []
+
+        # parent image ref
+        self.root = None
+
+        # byte identical copies, skipped and rated like this image
+        self.duplicates = []
+
+
+    def validate(self) -> bool:
+
+        # Validate file exists
+        if os.path.isfile(self.path):
+
+            # Ignore already processed file
+            if self.args.exclude:
+                if os.path.isfile(f"{self.path}.xmp"):
+                    logging.debug(f"Skipping already processed file: {self.filename}")
+                    return False
+
+            # validate image file
+            from image_ranking.content_type import is_image_file
+            if not is_image_file(self.content_type):
+                logging.debug(f"Skipping non-image file: {self.filename}, type: {self.content_type}")
+                return False
+
+            # raw image flag
+            from image_ranking.content_type import is_raw_image_file
+            self.raw_image = is_raw_image_file(self.content_type)
+
+            # log file timestamp
+            self.created = os.path.getctime(self.path)
+
+            # file exists and is valid
+            return True
+
+        # file does not exist
+        logging.debug(f"File does not exist: {self.filename}")
+        return False
+
+    def initialize(self, data: bytes = None):
+
+        # use in-memory data if not prefetched
+        if data is None:
+            data = self.data
+
+        # get exif data, decoded arrays only have metadata
+        from image_ranking.image_exif import get_exif
+        self.exif = {}
+        if data is None or isinstance(data, (bytes, bytearray, memoryview)):
+            self.exif = get_exif(self.path, data)
+        self.exif.update(self.metadata)
+
+        # cv2 processed image, persisted arena slots are already filled
+        from image_ranking.cv2_image_hash import cv2_process_image
+        if not self.arena_loaded:
+            self.processed_image = cv2_process_image(self.path, self.content_type, self.args, data=data)
+
+        # save image shape
+        self.shape = self.args.similarity_resize
+        if self.processed_image.shape is not None:
+            self.shape = self.processed_image.shape
+
+        # coarse comparison thumbnail
+        self.thumbnail = None
+        if self.args.cascade_band is not None:
+            from image_ranking.cv2_image_hash import cv2_thumbnail
+            self.thumbnail = cv2_thumbnail(self.processed_image)
+
+        # hash image
+        self.hash = hashlib.md5(str(self.processed_image).encode()).hexdigest()
+
+        # calculate score threshold
+        self.metric = self.args.diff
+        if not self.args.feature_matching:
+            self.metric = self.shape[0] * self.shape[1] * self.metric
+
+
+    def is_same_group(self, anotherImage) -> bool:
+
+        score = 0
+        result = False
+
+        # return if exif data mismatch
+        from image_ranking.image_exif import exif_match
+        if not exif_match(self.exif, anotherImage.exif):
+            logging.debug(f"EXIF mismatch: {self.filename} and {anotherImage.filename}")
+            stats_add("compare_exif_mismatch")
+            return result
+
+        # coarse compare, accept result outside of the ambiguous band
+        coarse = self.coarse_compare(anotherImage)
+        if coarse is not None:
+            score, result = coarse
+            stats_add(f"compare_coarse_{'same' if result else 'different'}")
+
+        # feature matching
+        elif self.args.feature_matching:
+            from image_ranking.image_similarity import image_similarity
+            score = image_similarity(
+                self.processed_image,
+                anotherImage.processed_image,
+                self.args.diff,
+                self.args.matcher)
+            result = score >= self.args.diff
+
+        # cv2 hash compare
+        else:
+            from image_ranking.cv2_image_hash import cv2_compare_image
+            score, res_cnts, thresh = cv2_compare_image(
+                self.processed_image,
+                anotherImage.processed_image,
+                self.args)
+            #delta is rougly number of total pixels
+            result = score < self.metric
+
+        # full compare
+        if coarse is None:
+            stats_add("compare_full")
+
+        # save similarity data
+        self.similar.append((anotherImage.filename, score, result))
+
+        # return compare result
+        return result
+
+    def coarse_compare(self, anotherImage) -> tuple | None:
+
+        # cascade disabled
+        if self.thumbnail is None or anotherImage.thumbnail is None:
+            return None
+
+        # estimated contour score of the full compare
+        from image_ranking.cv2_image_hash import cv2_coarse_compare
+        score = cv2_coarse_compare(self.thumbnail, anotherImage.thumbnail, self.args, self.shape)
+
+        # obviously same or obviously different, band is relative to the score threshold
+        low, high = self.args.cascade_band
+        if score <= low * self.metric:
+            return score, True
+        if score >= high * self.metric:
+            return score, False
+
+        # ambiguous, needs full compare
+        return None
+
+    def calculate_blur(self, data: bytes = None):
+        try:
+
+            # use in-memory data if not prefetched
+            if data is None:
+                data = self.data
+
+            # calculate blur
+            from image_ranking.image_blur import calculate_blur
+            self.blur = calculate_blur(
+                self.path,
+                self.content_type,
+                self.args.blur_mode,
+                self.args.blur_resize,
+                self.args.blur_crop,
+                data,
+                self.get_blur_window(),
+                self.args.blur_scaled_decode)
+
+            return True
+
+        except Exception as e:
+            logging.error(f"error calculating blur for {self.path}: {e}", exc_info=True)
+
+        return False
+
+
+    def get_blur_window(self) -> tuple | None:
+
+        # full resolution window around the focus point, image centre without focus data
+        if self.args.blur_window <= 0:
+            return None
+        from image_ranking.image_exif import get_focus_point
+        focus = get_focus_point(self.exif or {})
+        stats_add("blur_focus_points" if focus else "blur_focus_fallback")
+        x, y = focus or (0.5, 0.5)
+        return x, y, self.args.blur_window
+
+
+    @property
+    def processed_image(self):
+        # zero-copy arena view if assigned a slot
+        if self.arena is not None:
+            return self.arena[self.arena_index]
+        return self._processed_image
+
+
+    @processed_image.setter
+    def processed_image(self, image):
+        if self.arena is not None:
+            self.arena[self.arena_index] = image
+        else:
+            self._processed_image = image
+
+
+    @property
+    def root_hash(self) -> str:
+        # get image root hash, if self is root, get self hash
+        if not self.root: return self.hash
+        return self.root.hash
@@ -0,0 +1,108 @@
+# available descriptor matchers
+MATCHERS = ('bruteforce', 'flann', 'ratio')
+
+# query descriptors matched per chunk before checking early exit bounds
+MATCH_CHUNK_SIZE = 64
+
+# Lowe's ratio test threshold
+MATCH_RATIO = 0.75
+
+# FLANN LSH index parameters for binary (ORB) descriptors
+FLANN_INDEX_LSH = 6
+FLANN_INDEX_PARAMS = dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1)
+FLANN_SEARCH_PARAMS = dict(checks=50)
+
+
+def match_count(des1, des2, matcher: str = 'bruteforce', needed: int = None) -> tuple:
+    """
+    Count descriptor matches between two images
+    :param des1: query descriptors
+    :param des2: train descriptors
+    :param matcher: matcher backend (bruteforce, flann, ratio)
+    :param needed: match count that decides the comparison, enables early exit
+    :return: tuple(match count, early exit), on early exit the count is a
+             bound that lands on the same side of needed as the exact count
+    """
+
+    # upper bound on matches, each query descriptor matches at most once
+    upper = len(des1)
+    if matcher == 'bruteforce':
+        upper = min(len(des1), len(des2))
+
+    # exit if the threshold can not be reached
+    if needed is not None and upper < needed:
+        return upper, True
+
+    # imported on first match, the command line reads MATCHERS without loading OpenCV
+    import cv2
+
+    # cross checked brute force
+    if matcher == 'bruteforce':
+        return cross_check_count(cv2, des1, des2, needed)
+
+    # create knn matcher, train descriptors are indexed once
+    if matcher == 'flann':
+        knn = cv2.FlannBasedMatcher(FLANN_INDEX_PARAMS, FLANN_SEARCH_PARAMS)
+    elif matcher == 'ratio':
+        knn = cv2.BFMatcher(cv2.NORM_HAMMING)
+    else:
+        raise ValueError(f"unknown matcher: {matcher}, expected one of {', '.join(MATCHERS)}")
+    knn.add([des2])
+    knn.train()
+
+    # match query descriptors in chunks
+    count = 0
+    for start in range(0, len(des1), MATCH_CHUNK_SIZE):
+
+        # ratio test, keep match if clearly better than the runner up
+        for pair in knn.knnMatch(des1[start:start + MATCH_CHUNK_SIZE], k=2):
+            if len(pair) == 1 or (len(pair) == 2 and pair[0].distance < MATCH_RATIO * pair[1].distance):
+                count += 1
+
+        # early exit once the result is decided
+        if needed is not None:
+            remaining = max(len(des1) - start - MATCH_CHUNK_SIZE, 0)
+            if count >= needed:
+                return count, remaining > 0
+            if count + remaining < needed:
+                return count + remaining, remaining > 0
+
+    return count, False
+
+
+def cross_check_count(cv2, des1, des2, needed: int = None) -> tuple:
+    """
+    Cross checked brute force match count, the same matches as BFMatcher
+    with crossCheck. The train to query pass runs once, only query
+    descriptors that are the nearest of some train descriptor can match,
+    those are matched against the train descriptors in chunks until the
+    result is decided
+    :return: tuple(match count, early exit)
+    """
+    bf = cv2.BFMatcher(cv2.NORM_HAMMING)
+
+    # nearest query descriptor of every train descriptor
+    nearest = {match.queryIdx: match.trainIdx for match in bf.match(des2, des1)}
+    candidates = sorted(set(nearest.values()))
+
+    # exit if the threshold can not be reached
+    if needed is not None and len(candidates) < needed:
+        return len(candidates), True
+
+    # match candidates in chunks, a match is kept if it points back
+    count = 0
+    for start in range(0, len(candidates), MATCH_CHUNK_SIZE):
+        chunk = candidates[start:start + MATCH_CHUNK_SIZE]
+        for match in bf.match(des1[chunk], des2):
+            if nearest.get(match.trainIdx) == chunk[match.queryIdx]:
+                count += 1
+
+        # early exit once the result is decided
+        if needed is not None:
+            remaining = max(len(candidates) - start - MATCH_CHUNK_SIZE, 0)
+            if count >= needed:
+                return count, remaining > 0
+            if count + remaining < needed:
+                return count + remaining, remaining > 0
+
+    return count, False
@@ -0,0 +1,43 @@
+from image_ranking.image_exif import get_capture_time, get_sequence_number
+
+
+def is_partition_boundary(image_a, image_b, gap: float) -> bool:
+    """
+    Check if two adjacent images can never be in the same group
+    :param image_a: previous image
+    :param image_b: next image
+    :param gap: max capture time gap in seconds
+    :return: True if the images belong to different partitions
+    """
+
+    # capture time gap
+    time_a = get_capture_time(image_a.exif)
+    time_b = get_capture_time(image_b.exif)
+    if time_a is not None and time_b is not None and abs(time_b - time_a) > gap:
+        return True
+
+    # different drive mode sequence, the counter resets or single shots start / end a burst,
+    # gaps within a burst are culled or excluded frames
+    sequence_a = get_sequence_number(image_a.exif)
+    sequence_b = get_sequence_number(image_b.exif)
+    if sequence_a is not None and sequence_b is not None:
+        if (sequence_a > 0 or sequence_b > 0) and (sequence_b <= sequence_a or min(sequence_a, sequence_b) == 0):
+            return True
+
+    return False
+
+
+def partition_images(images: list, gap: float) -> list:
+    """
+    Split images into contiguous partitions at capture time gaps and drive
+    mode sequence changes, groups never span partitions
+    :param images: initialized images in capture order
+    :param gap: max capture time gap in seconds
+    :return: a list of partitions
+    """
+    partitions = []
+    for image in images:
+        if not partitions or is_partition_boundary(partitions[-1][-1], image, gap):
+            partitions.append([])
+        partitions[-1].append(image)
+    return partitions
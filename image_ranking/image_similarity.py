@@ -1,35 +1,46 @@
-import cv2
-import logging
-
-def image_similarity(img1, img2) -> float:
-
-    if img1 is None or img2 is None:
-        print("Error: Could not load one or both images.")
-        return None
-
-    # Initialize ORB detector
-    orb = cv2.ORB_create()
-
-    # Find keypoints and descriptors
-    kp1, des1 = orb.detectAndCompute(img1, None)
-    kp2, des2 = orb.detectAndCompute(img2, None)
-
-    if des1 is None or des2 is None:
-        logging.warning("Could not find enough descriptors in one or both images.")
-        return 0
-
-    # Create BFMatcher object
-    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-
-    # Match descriptors
-    matches = bf.match(des1, des2)
-
-    # Sort matches by distance
-    matches = sorted(matches, key=lambda x: x.distance)
-
-    # Calculate similarity based on the number of good matches
-    # A common approach is to consider a ratio of good matches to the total number of keypoints
-    similarity_score = len(matches) / max(len(kp1), len(kp2))
-
-    # Return similarity score between 0 and 1
-    return similarity_score
+import cv2
+import math
+import logging
+
+from image_ranking.image_matcher import match_count
+from image_ranking.stats import stats_add
+
+def image_similarity(img1, img2, threshold: float = None, matcher: str = 'bruteforce') -> float:
+
+    if img1 is None or img2 is None:
+        print("Error: Could not load one or both images.")
+        return None
+
+    # Initialize ORB detector
+    orb = cv2.ORB_create()
+
+    # Find keypoints and descriptors
+    kp1, des1 = orb.detectAndCompute(img1, None)
+    kp2, des2 = orb.detectAndCompute(img2, None)
+
+    if des1 is None or des2 is None:
+        logging.warning("Could not find enough descriptors in one or both images.")
+        return 0
+
+    # Calculate similarity based on the number of good matches
+    # A common approach is to consider a ratio of good matches to the total number of keypoints
+    total = max(len(kp1), len(kp2))
+
+    # smallest match count that reaches the threshold
+    needed = None
+    if threshold is not None:
+        needed = math.ceil(threshold * total)
+        if needed > 0 and (needed - 1) / total >= threshold:
+            needed -= 1
+
+    # Match descriptors, only the count is needed so matches are not sorted
+    count, early = match_count(des1, des2, matcher, needed)
+
+    # record match statistics
+    stats_add("match_pairs")
+    stats_add("match_count", count)
+    if early:
+        stats_add("match_early_exit")
+
+    # Return similarity score between 0 and 1
+    return count / total
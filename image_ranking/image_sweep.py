@@ -0,0 +1,287 @@
+import json
+import time
+import logging
+import argparse
+import itertools
+import threading
+
+from types import SimpleNamespace
+
+from image_ranking.image_group import ImageGrouper
+from image_ranking.get_and_hash_images import get_images, enumerate_list
+
+# sweepable options by the stage they invalidate
+PREPROCESS_OPTIONS = ('similarity_resize', 'similarity_crop', 'similarity_blur')
+SCORE_OPTIONS = ('feature_matching', 'matcher', 'similarity_delta', 'similarity_min_contour')
+THRESHOLD_OPTIONS = ('diff',)
+
+
+def freeze(value):
+    # lists are not hashable, sizes and blur radii become tuples
+    return tuple(value) if isinstance(value, list) else value
+
+
+def get_key(config: argparse.Namespace, options: tuple) -> tuple:
+    return tuple(freeze(getattr(config, option)) for option in options)
+
+
+def get_grid(path: str) -> list:
+    """
+    Expand parameter grid, {"option": [values], ...} into configurations
+    :param path: grid json file
+    :return: a list of dict(option: value)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        grid = json.load(f)
+
+    options = PREPROCESS_OPTIONS + SCORE_OPTIONS + THRESHOLD_OPTIONS
+    for option in grid:
+        if option not in options:
+            raise ValueError(f"option {option} can not be swept, supported: {', '.join(options)}")
+
+    names = list(grid)
+    values = [[freeze(v) for v in grid[name]] for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def get_ground_truth(path: str) -> dict:
+    # ground truth grouping, {"filename": "group label", ...}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def get_pairs(labels: list) -> set:
+    # index pairs sharing a label, groups are contiguous runs
+    pairs = set()
+    start = 0
+    for i in range(1, len(labels) + 1):
+        if i == len(labels) or labels[i] != labels[start]:
+            pairs.update(itertools.combinations(range(start, i), 2))
+            start = i
+    return pairs
+
+
+def get_precision_recall(truth: set, predicted: set) -> tuple:
+    # pairwise precision and recall, empty sets count as perfect
+    correct = len(truth & predicted)
+    precision = correct / len(predicted) if predicted else 1.0
+    recall = correct / len(truth) if truth else 1.0
+    return precision, recall
+
+
+class Sweep:
+
+    """
+    Parameter sweep over a labeled shoot, each image is decoded once into
+    the renditions of every preprocessing key, renditions are shared by
+    configurations with the same preprocessing and pair scores by
+    configurations with the same scoring, so threshold values only cost
+    the grouping pass
+    :param args: arguments namespace, base values for options not in the grid
+    :param images: initialized images in capture order
+    :param labels: ground truth group label per image
+    """
+    def __init__(self, args: argparse.Namespace, images: list, labels: list):
+        self.args = args
+        self.images = images
+        self.truth = get_pairs(labels)
+
+        # decode seconds, shared by all configurations
+        self.decode_seconds = 0
+
+        # preprocessing key -> (renditions, seconds)
+        self.renditions = {}
+
+        # score key -> {(i, j): (score, seconds)}
+        self.scores = {}
+        self.lock = threading.Lock()
+
+
+    def get_config(self, values: dict) -> argparse.Namespace:
+        config = argparse.Namespace(**vars(self.args))
+        for name, value in values.items():
+            setattr(config, name, value)
+        return config
+
+
+    def prepare(self, configs: list):
+        """
+        Decode each image once and build the renditions of every preprocessing
+        key right away, the full size grayscale image is dropped afterwards so
+        only as many are held as images are prepared in parallel
+        :param configs: grid configurations
+        """
+        logging.info("sweep decode and preprocess")
+        from image_ranking.cv2_image_hash import cv2_get_image, cv2_process_image
+
+        # one configuration per preprocessing key
+        configs_by_key = {}
+        for config in configs:
+            configs_by_key.setdefault(get_key(config, PREPROCESS_OPTIONS), config)
+
+        # resize, blur and crop the decoded image for every key
+        def prepare_image(image) -> tuple:
+            start = time.perf_counter()
+            decoded = cv2_get_image(image.path, image.content_type, True, image.data)
+            decode_seconds = time.perf_counter() - start
+
+            renditions = {}
+            for key, config in configs_by_key.items():
+                start = time.perf_counter()
+                rendition = cv2_process_image(image.path, image.content_type, config, data=decoded)
+                renditions[key] = (rendition, time.perf_counter() - start)
+            return decode_seconds, renditions
+
+        results = enumerate_list(prepare_image, self.images, self.args.threads)
+        self.decode_seconds = sum(decode_seconds for decode_seconds, renditions in results)
+        for key in configs_by_key:
+            self.renditions[key] = ([renditions[key][0] for decode_seconds, renditions in results],
+                                    sum(renditions[key][1] for decode_seconds, renditions in results))
+
+
+    def score(self, config: argparse.Namespace, renditions: list, i: int, j: int) -> tuple:
+        """
+        Memoized pair score
+        :return: tuple(score, seconds), score is None on exif mismatch
+        """
+        key = get_key(config, PREPROCESS_OPTIONS + SCORE_OPTIONS)
+        with self.lock:
+            scores = self.scores.setdefault(key, {})
+            if (i, j) in scores:
+                return scores[(i, j)]
+
+        start = time.perf_counter()
+        score = None
+        from image_ranking.image_exif import exif_match
+        if exif_match(self.images[i].exif, self.images[j].exif):
+
+            # feature matching, full match count so every threshold can use it
+            if config.feature_matching:
+                from image_ranking.image_similarity import image_similarity
+                score = image_similarity(renditions[i], renditions[j], None, config.matcher)
+
+            # cv2 hash compare
+            else:
+                from image_ranking.cv2_image_hash import cv2_compare_image
+                score, res_cnts, thresh = cv2_compare_image(renditions[i], renditions[j], config)
+
+        result = (score, time.perf_counter() - start)
+        with self.lock:
+            scores[(i, j)] = result
+        return result
+
+
+    def evaluate(self, values: dict) -> dict:
+        """
+        Group with one configuration and compare against the ground truth
+        :param values: swept option values
+        :return: configuration result
+        """
+        start = time.perf_counter()
+        config = self.get_config(values)
+        key = get_key(config, PREPROCESS_OPTIONS)
+        renditions, preprocess_seconds = self.renditions[key]
+
+        compares = 0
+        compare_seconds = 0
+
+        # same decision as ImageHash.is_same_group on the shared scores
+        def compare(a, b) -> bool:
+            nonlocal compares, compare_seconds
+            score, seconds = self.score(config, renditions, a.index, b.index)
+            compares += 1
+            compare_seconds += seconds
+            if score is None:
+                return False
+            if config.feature_matching:
+                return score >= config.diff
+            shape = renditions[a.index].shape
+            return score < shape[0] * shape[1] * config.diff
+
+        # group index nodes, the images are shared between configurations
+        grouper = ImageGrouper(compare=compare)
+        labels = []
+        for i in range(len(self.images)):
+            grouper.add(SimpleNamespace(index=i, root=None))
+            labels.append(grouper.root.index)
+
+        precision, recall = get_precision_recall(self.truth, get_pairs(labels))
+        return {
+            'config': values,
+            'precision': precision,
+            'recall': recall,
+            'f1': 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0,
+            'groups': len(set(labels)),
+            'compares': compares,
+
+            # standalone similarity cost, preprocessing and the pairs this configuration compared
+            'seconds': preprocess_seconds + compare_seconds,
+            'sweep_seconds': time.perf_counter() - start,
+        }
+
+
+    def run(self, grid: list) -> list:
+        """
+        Evaluate all grid configurations
+        :param grid: a list of dict(option: value)
+        :return: a list of configuration results
+        """
+        self.prepare([self.get_config(values) for values in grid])
+
+        # group with threshold values of a scoring key next to each other, they share scores
+        logging.info("sweep evaluate")
+        order = sorted(range(len(grid)), key=lambda i: repr(
+            [(k, v) for k, v in sorted(grid[i].items()) if k not in THRESHOLD_OPTIONS]))
+        results = enumerate_list(self.evaluate, [grid[i] for i in order], self.args.threads)
+        return results
+
+
+def log_sweep(results: list, decode_seconds: float):
+    # fastest accurate settings first
+    results = sorted(results, key=lambda r: (-round(r['f1'], 4), r['seconds']))
+    message = f"sweep results, decode {decode_seconds:.2f} seconds (shared)"
+    message += f"\n  {'precision':>9} {'recall':>7} {'f1':>6} {'groups':>6} {'compares':>8} {'seconds':>8}  config"
+    for r in results:
+        message += (f"\n  {r['precision']:>9.3f} {r['recall']:>7.3f} {r['f1']:>6.3f} {r['groups']:>6} "
+                    f"{r['compares']:>8} {r['seconds']:>8.2f}  {json.dumps(r['config'])}")
+    logging.info(message)
+
+
+def run_sweep(args: argparse.Namespace) -> list:
+    """
+    Sweep a parameter grid against a labeled ground truth grouping
+    :param args: arguments namespace, args.sweep is the grid json and
+                 args.ground_truth the labels json
+    :return: configuration results
+    """
+    grid = get_grid(args.sweep)
+    truth = get_ground_truth(args.ground_truth)
+
+    # labeled images only
+    images = [image for image, file_part in get_images(args)]
+    unlabeled = [image.filename for image in images if image.filename not in truth]
+    if unlabeled:
+        logging.warning(f"{len(unlabeled)} image(s) without ground truth label skipped")
+    images = [image for image in images if image.filename in truth]
+
+    # exif is independent of the swept options
+    logging.info("sweep exif")
+    from image_ranking.image_exif import get_exif
+
+    def read_exif(image):
+        image.exif = get_exif(image.path, image.data)
+        image.exif.update(image.metadata)
+        return image
+
+    images = enumerate_list(read_exif, images, args.threads)
+
+    sweep = Sweep(args, images, [truth[image.filename] for image in images])
+    results = sweep.run(grid)
+    log_sweep(results, sweep.decode_seconds)
+
+    # save results next to the grid
+    path = f"{args.sweep}.results.json"
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    logging.info(f"sweep results saved to {path}")
+    return results
@@ -0,0 +1,249 @@
+import os
+import json
+import logging
+import argparse
+import threading
+
+from image_ranking.image_cache import CACHE_STAGES
+from image_ranking.stats import stats_add
+
+# journal file next to the images
+JOURNAL_FILE = '.image-ranking-journal.jsonl'
+
+# record format version, journals of another version are not resumed
+JOURNAL_VERSION = 1
+
+
+def get_journal_options(args: argparse.Namespace) -> dict:
+    # options the listing, groups, blur values and ratings depend on, as read back from json
+    options = ['limit', 'duplicates', 'partition_gap', 'max_rank', 'matcher', 'similarity_delta',
+               'similarity_min_contour']
+    for fields, stage_options in CACHE_STAGES.values():
+        options.extend(stage_options)
+    return json.loads(json.dumps({option: getattr(args, option, None) for option in options}, default=str))
+
+
+def get_file_key(path: str) -> list | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class RunJournal:
+
+    """
+    Append-only journal of a run, records image hashes, blur values, closed
+    groups and written ratings so an interrupted run can resume. Records are
+    json lines, a line torn by the interruption is dropped on resume. Hashes
+    and blur values are restored and stored like the image cache, images of
+    groups that were closed and blur scored are not decoded again.
+    :param args: arguments namespace
+    :param resume: continue the existing journal if it was written by this version with the same options
+    """
+    def __init__(self, args: argparse.Namespace, resume: bool = False):
+        self.directory = args.directory
+        self.path = os.path.join(args.directory, JOURNAL_FILE)
+        self.options = get_journal_options(args)
+        self.lazy_blur = getattr(args, 'lazy_blur', False)
+        self.lock = threading.Lock()
+
+        # image listing of the run, None until started
+        self.files = None
+
+        # filename -> (file key, hash, metric)
+        self.initialize = {}
+
+        # filename -> (file key, blur)
+        self.blur = {}
+
+        # closed groups, lists of filenames in capture order
+        self.groups = []
+
+        # filename -> closed group of the previous run
+        self.grouped = {}
+
+        # filename -> written rating
+        self.ratings = {}
+
+        # load previous run, drop a torn last record
+        self.resumed = False
+        end = 0
+        if resume:
+            end = self.load()
+        self.file = open(self.path, 'r+b' if self.resumed else 'wb')
+        self.file.truncate(end)
+        self.file.seek(end)
+
+
+    def load(self) -> int:
+        """
+        Read journal records
+        :return: offset after the last complete record
+        """
+        end = 0
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    # a torn record has no line end or is not a valid record
+                    try:
+                        if not line.endswith(b'\n') or not self.replay(json.loads(line)):
+                            break
+                    except (ValueError, TypeError, KeyError, AttributeError):
+                        break
+                    end += len(line)
+        except OSError:
+            logging.info("no journal to resume, starting a new run")
+            return 0
+
+        if self.files is None:
+            logging.warning("journal was written by another version or with different options, starting a new run")
+            self.initialize, self.blur, self.groups, self.ratings = {}, {}, [], {}
+            return 0
+
+        self.grouped = {filename: filenames for filenames in self.groups for filename in filenames}
+        self.resumed = True
+        logging.info(f"resuming: {len(self.initialize)} hashes, {len(self.blur)} blur values, {len(self.groups)} groups, "
+                     f"{len(self.ratings)} ratings")
+        return end
+
+
+    def replay(self, record: dict) -> bool:
+        """
+        Apply a journal record
+        :return: False to stop reading, the run record did not match
+        """
+        if self.files is None:
+            if record.get('version') != JOURNAL_VERSION or record.get('options') != self.options:
+                return False
+            self.files = [str(file) for file in record['files']]
+        elif 'initialize' in record:
+            self.initialize[record['initialize']] = (record['key'], str(record['hash']), float(record['metric']))
+        elif 'blur' in record:
+            self.blur[record['blur']] = (record['key'], float(record['value']))
+        elif 'group' in record:
+            self.groups.append([str(file) for file in record['group']])
+        elif 'rating' in record:
+            self.ratings[record['rating']] = int(record['rank'])
+        return True
+
+
+    def write(self, record: dict, sync: bool = False):
+        data = (json.dumps(record) + '\n').encode()
+        with self.lock:
+            self.file.write(data)
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+
+
+    def start(self, images: list):
+        """
+        Record the image listing, a resumed run keeps the listing of the interrupted run
+        :param images: a list of tuple(image, file_part)
+        """
+        if self.files is None:
+            self.files = [item[0].filename for item in images]
+            self.write({'version': JOURNAL_VERSION, 'options': self.options, 'files': self.files}, True)
+
+
+    def restore(self, image, stage: str) -> bool:
+        """
+        Restore journaled stage output into image, the hash and metric only for
+        images that don't need pixels, their group was closed and blur scored
+        :return: True if found
+        """
+        if stage == 'initialize':
+            entry = self.initialize.get(image.filename)
+            if entry is None or entry[0] != get_file_key(image.path) or not self.is_finished(image.filename):
+                return False
+            image.hash, image.metric = entry[1], entry[2]
+            image.exif = dict(image.metadata)
+
+            # no similarity image, the arena slot stays unfilled
+            image.arena = None
+            image.arena_index = None
+        else:
+            entry = self.blur.get(image.filename) if stage == 'blur' else None
+            if entry is None or entry[0] != get_file_key(image.path):
+                return False
+            image.blur = entry[1]
+        stats_add(f"resumed_{stage}")
+        return True
+
+
+    def is_finished(self, filename: str) -> bool:
+        # closed group with a blur value per image to rank by, lazy blur doesn't score an image alone
+        filenames = self.grouped.get(filename)
+        if filenames is None:
+            return False
+        if len(filenames) == 1 and self.lazy_blur:
+            return True
+        for filename in filenames:
+            entry = self.blur.get(filename)
+            if entry is None or entry[0] != get_file_key(os.path.join(self.directory, filename)):
+                return False
+        return True
+
+
+    def store(self, image, stage: str):
+        if stage == 'initialize':
+            self.write({'initialize': image.filename, 'key': get_file_key(image.path), 'hash': image.hash,
+                        'metric': float(image.metric)})
+        elif stage == 'blur' and image.blur is not None:
+            self.write({'blur': image.filename, 'key': get_file_key(image.path), 'value': float(image.blur)})
+
+
+    def restore_groups(self, images: list) -> list:
+        """
+        Restore groups closed before the interruption
+        :param images: initialized images in capture order
+        :return: images that still need grouping
+        """
+        by_filename = {image.filename: image for image in images}
+        grouped = set()
+        for filenames in self.groups:
+            if not all(filename in by_filename for filename in filenames):
+                continue
+            root = by_filename[filenames[0]]
+            for filename in filenames[1:]:
+                by_filename[filename].root = root
+            grouped.update(filenames)
+            stats_add("resumed_groups")
+        return [image for image in images if image.filename not in grouped]
+
+
+    def group(self, images: list):
+        # record closed group
+        self.write({'group': [image.filename for image in images]}, True)
+
+
+    def is_rated(self, image) -> bool:
+        """
+        Check if the rating was written before the interruption, an xmp that
+        already has the rating counts as written, the run may have stopped
+        between writing it and recording it
+        """
+        if image.filename in self.ratings:
+            stats_add("resumed_ratings")
+            return True
+        if self.resumed and image.rank > 0:
+            from image_ranking.darktable_set_rating import darktable_get_rating
+            if darktable_get_rating(f"{image.path}.xmp") == image.rank:
+                self.rating(image)
+                stats_add("resumed_ratings")
+                return True
+        return False
+
+
+    def rating(self, image):
+        # record written rating
+        self.write({'rating': image.filename, 'rank': int(image.rank)}, True)
+
+
+    def finish(self):
+        # run completed, nothing left to resume
+        with self.lock:
+            self.file.close()
+        os.remove(self.path)
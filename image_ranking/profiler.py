@@ -0,0 +1,180 @@
+import os
+import sys
+import time
+import logging
+import threading
+
+from collections import Counter
+from contextlib import contextmanager
+
+# sampling interval in seconds
+SAMPLE_INTERVAL = 0.005
+
+# rows of the hot function table
+TOP_FUNCTIONS = 15
+
+# innermost frames of threads waiting for work, not counted as active
+IDLE_FRAMES = {('threading.py', 'wait'), ('queue.py', 'get'), ('thread.py', '_worker'),
+               ('threading.py', '_wait_for_tstate_lock'), ('selectors.py', 'select')}
+
+
+class StageSamples:
+
+    """
+    Samples of one stage
+    :param name: stage name
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0
+        self.samples = 0
+        self.stacks = Counter()
+        self.own = Counter()
+        self.total = Counter()
+        self.idle = 0
+
+        # sampler wake up latency, time spent waiting to reacquire the GIL
+        self.latency = 0
+        self.gil_wait = 0
+
+
+def get_frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def get_thread_label(name: str) -> str:
+    # pool workers share a label, ThreadPoolExecutor-0_3 -> ThreadPoolExecutor-0
+    return name.rsplit('_', 1)[0] if name.rsplit('_', 1)[-1].isdigit() else name
+
+
+class StageProfiler:
+
+    """
+    Sampling profiler for all threads, samples every thread's stack while a
+    stage is active. Worker threads waiting on the GIL are estimated from
+    the sampler's own wake up latency, it waits for the GIL like any other
+    thread, times the number of threads active at that sample.
+    :param interval: sampling interval in seconds
+    """
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stages = {}
+        self.current = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+
+    @contextmanager
+    def stage(self, name: str):
+        samples = self.stages.setdefault(name, StageSamples(name))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+            self.thread.start()
+
+        start_time = time.perf_counter()
+        self.current = samples
+        try:
+            yield samples
+        finally:
+            self.current = None
+            samples.seconds += time.perf_counter() - start_time
+
+
+    def run(self):
+        own = threading.get_ident()
+        expected = time.perf_counter() + self.interval
+        while not self.stopped.wait(max(0, expected - time.perf_counter())):
+            now = time.perf_counter()
+            latency = max(0, now - expected)
+            expected = now + self.interval
+
+            samples = self.current
+            if samples is not None:
+                self.sample(samples, own, latency)
+
+
+    def sample(self, samples: StageSamples, own: int, latency: float):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        active = 0
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+
+            # idle pool workers
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                samples.idle += 1
+                continue
+            active += 1
+
+            # outermost frame first
+            stack = []
+            while frame is not None:
+                stack.append(get_frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+
+            samples.stacks[';'.join([get_thread_label(names.get(ident, str(ident)))] + stack)] += 1
+            samples.own[stack[-1]] += 1
+            for label in set(stack):
+                samples.total[label] += 1
+
+        samples.samples += 1
+        samples.latency += latency
+        samples.gil_wait += latency * active
+
+
+    def merge(self, stages: dict, prefix: str):
+        """
+        Add the samples of another process, stacks are labeled with the process
+        :param stages: stage name -> StageSamples of the other process's profiler
+        :param prefix: process label, e.g. shard-0
+        """
+        for name, other in stages.items():
+            samples = self.stages.setdefault(name, StageSamples(name))
+
+            # processes run the stage in parallel, wall time is the longest
+            samples.seconds = max(samples.seconds, other.seconds)
+            samples.samples += other.samples
+            samples.stacks.update({f"{prefix}/{stack}": count for stack, count in other.stacks.items()})
+            samples.own.update(other.own)
+            samples.total.update(other.total)
+            samples.idle += other.idle
+            samples.latency += other.latency
+            samples.gil_wait += other.gil_wait
+
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+    def write(self, directory: str):
+        """
+        Write collapsed stacks per stage (flamegraph.pl, speedscope) and log
+        the hot function table
+        :param directory: output directory
+        """
+        os.makedirs(directory, exist_ok=True)
+        message = f"profile, {self.interval * 1000:.0f}ms samples written to {directory}"
+
+        # without a GIL the sampler's latency is scheduling only, not lock waits
+        from image_ranking.free_threading import is_gil_enabled
+        gil = is_gil_enabled()
+        for samples in self.stages.values():
+            with open(os.path.join(directory, f"{samples.name}.folded"), 'w', encoding='utf-8') as f:
+                for stack, count in samples.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+            thread_samples = sum(samples.own.values())
+            gil_wait = f"gil wait ~{samples.gil_wait:.2f} thread seconds" if gil else "no gil"
+            message += (f"\n  {samples.name}: {samples.seconds:.2f} seconds, {samples.samples} samples, "
+                        f"{samples.idle} idle thread samples, {gil_wait} "
+                        f"(sampler latency {samples.latency / max(samples.samples, 1) * 1000:.2f}ms)")
+            message += f"\n    {'own %':>7} {'total %':>8}  function"
+            for label, count in samples.own.most_common(TOP_FUNCTIONS):
+                message += (f"\n    {count / thread_samples * 100:>7.1f} "
+                            f"{samples.total[label] / thread_samples * 100:>8.1f}  {label}")
+        logging.info(message)
@@ -0,0 +1,13 @@
+from tqdm import tqdm
+
+# per stage progress bars, a batch run shows one global bar instead
+_enabled = True
+
+
+def set_progress(enabled: bool):
+    global _enabled
+    _enabled = enabled
+
+
+def progress(iterable, total: int = None) -> tqdm:
+    return tqdm(iterable, total=total, ascii=' =', disable=not _enabled)
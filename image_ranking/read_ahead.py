@@ -0,0 +1,128 @@
+import os
+import time
+import logging
+import threading
+
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from image_ranking.stats import stats_add, stats_set
+from image_ranking.progress import progress
+
+
+def read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class ReadAhead:
+
+    """
+    Read-ahead I/O stage, prefetches file bytes in list order on a dedicated
+    I/O pool and hands the buffers to a CPU sized decode pool
+    :param io_threads: number of concurrent reads
+    :param threads: number of concurrent decodes
+    :param budget: max bytes read but not yet decoded
+    :param reader: file reader, callable(path) -> bytes
+    """
+    def __init__(self, io_threads: int, threads: int, budget: int, reader: callable = read_file):
+        self.io_threads = io_threads
+        self.threads = threads
+        self.budget = budget
+        self.reader = reader
+
+        # bytes currently in flight
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+
+    def acquire(self, size: int):
+        with self.condition:
+
+            # always admit a single file, even if larger than the budget
+            while self.in_flight > 0 and self.in_flight + size > self.budget:
+                self.condition.wait()
+            self.in_flight += size
+
+
+    def release(self, size: int):
+        with self.condition:
+            self.in_flight -= size
+            self.condition.notify_all()
+
+
+    def map(self, operation: callable, array: list, get_path: callable, stage: str = "read_ahead",
+            executor: ThreadPoolExecutor = None) -> list:
+        """
+        Apply operation(item, data) to every item, in order
+        :param operation: decode operation, called with the item and its file bytes
+        :param array: items to process
+        :param get_path: returns the file path of an item
+        :param stage: statistics prefix
+        :param executor: shared decode pool, a pool of threads workers is created if None
+        :return: operation results, None for items that failed to read or process
+        """
+
+        read_bytes = 0
+        read_seconds = 0
+        lock = threading.Lock()
+
+        start_time = time.perf_counter()
+        start_cpu = time.process_time()
+
+        with ThreadPoolExecutor(max_workers=self.io_threads) as io_executor, \
+                (nullcontext(executor) if executor else ThreadPoolExecutor(max_workers=self.threads)) as cpu_executor:
+
+            # decode buffer, release its budget when done
+            def decode(item, data: bytes, size: int):
+                try:
+                    return operation(item, data)
+                except Exception as e:
+                    logging.error(f"Error processing file {get_path(item)}: {e}")
+                    return None
+                finally:
+                    self.release(size)
+
+            # read file, then queue decode, a failed read skips the item
+            def read(item, size: int):
+                nonlocal read_bytes, read_seconds
+                try:
+                    read_start = time.perf_counter()
+                    data = self.reader(get_path(item))
+                    with lock:
+                        read_bytes += len(data)
+                        read_seconds += time.perf_counter() - read_start
+                except Exception as e:
+                    logging.error(f"Error reading file {get_path(item)}: {e}")
+                    self.release(size)
+                    return None
+                return cpu_executor.submit(decode, item, data, size)
+
+            # submit reads in order, waiting on the byte budget
+            futures = []
+            for item in array:
+                try:
+                    size = os.path.getsize(get_path(item))
+                except OSError as e:
+                    logging.error(f"Error reading file {get_path(item)}: {e}")
+                    futures.append(None)
+                    continue
+                self.acquire(size)
+                futures.append(io_executor.submit(read, item, size))
+
+            # collect results in order, None for failed items
+            result = []
+            for future in progress(futures, total=len(futures)):
+                decoded = future.result() if future is not None else None
+                result.append(decoded.result() if decoded is not None else None)
+
+        # record throughput and cpu utilisation
+        elapsed = time.perf_counter() - start_time
+        cpu = time.process_time() - start_cpu
+        stats_add(f"{stage}_bytes", read_bytes)
+        stats_add(f"{stage}_read_seconds", read_seconds)
+        if elapsed > 0:
+            stats_set(f"{stage}_mb_per_s", read_bytes / elapsed / 1024 ** 2)
+            stats_set(f"{stage}_cpu_utilisation", cpu / (elapsed * (os.cpu_count() or 1)))
+
+        return result
@@ -0,0 +1,240 @@
+import os
+import time
+import logging
+import threading
+
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from image_ranking.stats import stats_set
+
+# cpu fraction floor, a stage never gets more than cores / floor workers
+MIN_CPU_FRACTION = 1 / 8
+
+# completions per throughput measurement
+WINDOW_SIZE = 8
+
+# throughput change treated as noise
+THROUGHPUT_TOLERANCE = 0.05
+
+# process cpu utilisation above which workers only wait for a core
+SATURATED_UTILISATION = 0.9
+
+
+class StageProfile:
+
+    """
+    Measured profile and in-flight limit of one stage
+    :param name: stage name, the operation function name
+    :param limit: initial in-flight limit
+    """
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.limits = [limit]
+        self.tasks = 0
+        self.cpu = 0
+        self.wall = 0
+        self.in_flight = 0
+
+        # cv2 thread counts in effect while the stage was mapped
+        self.cv2_threads = []
+
+        # hill climbing state
+        self.profiled = False
+        self.window = 0
+        self.window_start = None
+        self.window_cpu = None
+        self.throughput = None
+        self.direction = 1
+
+
+    @property
+    def cpu_fraction(self) -> float:
+        return self.cpu / self.wall if self.wall > 0 else 1.0
+
+
+class StageScheduler(Executor):
+
+    """
+    Executor with a per stage in-flight limit, stages are keyed on the
+    operation function. Each task's thread cpu time is measured against its
+    wall time, the first window sizes the stage to cores / cpu fraction so
+    I/O bound stages get more workers than cores, later windows hill climb
+    on throughput. OpenCV's internal pool is process global, it gets the
+    cores left per worker of all stages being mapped.
+    :param threads: cpu cores to schedule for
+    :param max_workers: max in-flight tasks of any stage
+    """
+    def __init__(self, threads: int, max_workers: int = None):
+        self.threads = max(1, threads)
+        self.max_workers = max_workers or self.threads * 4
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.stages = {}
+        self.condition = threading.Condition()
+
+        # stages being mapped, stage -> running maps
+        self.active = {}
+        self.cv2_threads = None
+        self.update_cv2_threads()
+
+
+    def get_stage(self, fn: callable) -> StageProfile:
+        # partials are keyed on the wrapped function
+        name = getattr(getattr(fn, 'func', fn), '__name__', 'task')
+        with self.condition:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = StageProfile(name, self.threads)
+            return stage
+
+
+    def set_cv2_threads(self, threads: int):
+        try:
+            import cv2
+            cv2.setNumThreads(threads)
+        except ImportError:
+            pass
+
+
+    def update_cv2_threads(self):
+        # called with the condition held when the mapped stages or their limits change
+        workers = sum(stage.limit for stage in self.active)
+        threads = max(1, self.threads // workers) if workers else self.threads
+        if threads != self.cv2_threads:
+            self.cv2_threads = threads
+            self.set_cv2_threads(threads)
+        for stage in self.active:
+            if not stage.cv2_threads or stage.cv2_threads[-1] != threads:
+                stage.cv2_threads.append(threads)
+
+
+    def run(self, stage: StageProfile, fn: callable, args: tuple, kwargs: dict):
+        # measure thread cpu and wall time of a task
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            cpu = time.thread_time() - cpu
+            wall = time.perf_counter() - wall
+            with self.condition:
+                stage.tasks += 1
+                stage.cpu += cpu
+                stage.wall += wall
+                stage.in_flight -= 1
+                self.adapt(stage)
+                self.condition.notify_all()
+
+
+    def adapt(self, stage: StageProfile):
+        # called with the condition held after every completion
+        now = time.perf_counter()
+        cpu = time.process_time()
+        if stage.window_start is None:
+            stage.window_start = now
+            stage.window_cpu = cpu
+        stage.window += 1
+        if stage.window < max(WINDOW_SIZE, stage.limit):
+            return
+        elapsed = max(now - stage.window_start, 1e-9)
+        throughput = stage.window / elapsed
+
+        # waiting for a core looks like I/O to the task, don't grow a saturated process
+        utilisation = (cpu - stage.window_cpu) / (elapsed * (os.cpu_count() or 1))
+        stage.window = 0
+        stage.window_start = now
+        stage.window_cpu = cpu
+
+        # first window, size by cpu fraction
+        if not stage.profiled:
+            stage.profiled = True
+            limit = round(self.threads / max(stage.cpu_fraction, MIN_CPU_FRACTION))
+
+        # keep direction while throughput improves, reverse otherwise
+        else:
+            if stage.throughput is not None and throughput < stage.throughput * (1 - THROUGHPUT_TOLERANCE):
+                stage.direction = -stage.direction
+            limit = stage.limit + stage.direction * max(1, stage.limit // 4)
+
+        stage.throughput = throughput
+        if utilisation >= SATURATED_UTILISATION:
+            limit = min(limit, stage.limit)
+        limit = max(1, min(self.max_workers, limit))
+        if limit != stage.limit:
+            stage.limit = limit
+            stage.limits.append(limit)
+            if stage in self.active:
+                self.update_cv2_threads()
+            logging.debug(f"scheduler: {stage.name} in-flight limit {limit} "
+                          f"(cpu {stage.cpu_fraction:.2f}, {throughput:.1f} tasks/s)")
+
+
+    def submit(self, fn: callable, /, *args, **kwargs):
+        # unbounded, used for decodes queued by the read-ahead stage
+        stage = self.get_stage(fn)
+        with self.condition:
+            stage.in_flight += 1
+        return self.executor.submit(self.run, stage, fn, args, kwargs)
+
+
+    def map(self, fn: callable, *iterables, timeout=None, chunksize=1):
+        """
+        Apply fn to every item with the stage's in-flight limit, results are
+        yielded in order
+        """
+        stage = self.get_stage(fn)
+        items = iter(zip(*iterables))
+        futures = deque()
+
+        # cv2 gets the cores left per worker while the stage runs
+        with self.condition:
+            self.active[stage] = self.active.get(stage, 0) + 1
+            self.update_cv2_threads()
+
+        def fill() -> bool:
+            # submit until the stage limit is reached, False when items ran out
+            for item in items:
+                with self.condition:
+                    while stage.in_flight >= stage.limit and futures:
+                        self.condition.wait()
+                    stage.in_flight += 1
+                futures.append(self.executor.submit(self.run, stage, fn, item, {}))
+                with self.condition:
+                    if stage.in_flight >= stage.limit:
+                        return True
+            return False
+
+        def results():
+            try:
+                more = fill()
+                while futures:
+                    yield futures.popleft().result(timeout)
+                    if more:
+                        more = fill()
+            finally:
+                for future in futures:
+                    future.cancel()
+                with self.condition:
+                    self.active[stage] -= 1
+                    if not self.active[stage]:
+                        del self.active[stage]
+                    self.update_cv2_threads()
+
+        return results()
+
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        self.executor.shutdown(wait, cancel_futures=cancel_futures)
+
+
+    def report(self):
+        # log the worker counts chosen per stage and the cv2 threads that were set while it was mapped
+        message = "scheduler:"
+        for stage in self.stages.values():
+            message += (f"\n  {stage.name}: {stage.tasks} tasks, cpu {stage.cpu_fraction:.2f}, "
+                        f"workers {' -> '.join(str(limit) for limit in stage.limits)}")
+            if stage.cv2_threads:
+                message += f", cv2 threads {' -> '.join(str(threads) for threads in stage.cv2_threads)}"
+            stats_set(f"{stage.name}_workers", stage.limit)
+        logging.info(message)
@@ -0,0 +1,195 @@
+import json
+import time
+import queue
+import logging
+import itertools
+import threading
+
+from dataclasses import fields
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from image_ranking.core import Core, get_rating_groups
+from image_ranking.config import RankingConfig
+from image_ranking.image_cache import ImageCache
+from image_ranking.stats import stats_reset, stats_snapshot
+
+
+# job stages in run order
+JOB_STAGES = ('queued', 'get_and_hash_images', 'group', 'calculate_blur', 'apply_ratings', 'done')
+
+
+class RankingJob:
+
+    """
+    Ranking job for a single directory
+    :param id: job id
+    :param config: ranking configuration
+    :param priority: lower runs first
+    """
+    def __init__(self, id: int, config: RankingConfig, priority: int = 0):
+        self.id = id
+        self.config = config
+        self.priority = priority
+        self.stage = 'queued'
+        self.images = 0
+        self.groups = 0
+        self.error = None
+        self.stats = {}
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+
+    def status(self) -> dict:
+        return {
+            'id': self.id,
+            'directory': str(self.config.directory),
+            'priority': self.priority,
+            'stage': self.stage,
+            'progress': JOB_STAGES.index(self.stage) / (len(JOB_STAGES) - 1),
+            'images': self.images,
+            'groups': self.groups,
+            'error': self.error,
+            'queued_seconds': (self.started or time.time()) - self.submitted,
+            'run_seconds': ((self.finished or time.time()) - self.started) if self.started else 0,
+            'stats': self.stats,
+        }
+
+
+class RankingService:
+
+    """
+    Long running ranking service, keeps the worker pool, decoders and image
+    cache warm and runs queued jobs in priority order
+    :param threads: worker pool size
+    :param cache_entries: max cached stage outputs
+    """
+    def __init__(self, threads: int, cache_entries: int = 20000):
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.cache = ImageCache(cache_entries)
+
+        self.jobs = {}
+        self.queue = queue.PriorityQueue()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+        # import decoders up front
+        warm_decoders()
+
+        # job runner
+        self.runner = threading.Thread(target=self.run, daemon=True)
+        self.runner.start()
+
+
+    def submit(self, options: dict, priority: int = 0) -> RankingJob:
+        """
+        Queue a ranking job
+        :param options: RankingConfig fields, directory is required
+        :param priority: lower runs first
+        :return: job
+        """
+        names = {f.name for f in fields(RankingConfig)}
+        config = RankingConfig(**{k: v for k, v in options.items() if k in names})
+        config.threads = self.threads
+        if not config.directory:
+            raise ValueError("directory is required")
+
+        with self.lock:
+            job = RankingJob(next(self.ids), config, priority)
+            self.jobs[job.id] = job
+        self.queue.put((priority, job.id))
+        logging.info(f"job {job.id} queued: {config.directory}")
+        return job
+
+
+    def run(self):
+        while True:
+            priority, id = self.queue.get()
+            job = self.jobs[id]
+            try:
+                self.run_job(job)
+            except Exception as e:
+                logging.error(f"job {job.id} failed: {e}", exc_info=True)
+                job.error = str(e)
+            finally:
+                job.finished = time.time()
+
+
+    def run_job(self, job: RankingJob):
+        job.started = time.time()
+        stats_reset()
+
+        # run stages on the shared pool and cache
+        core = Core(job.config, self.executor, self.cache)
+        for stage in JOB_STAGES[1:-1]:
+            job.stage = stage
+            getattr(core, stage)()
+            job.images = len(core.images_list)
+
+        job.groups = len(get_rating_groups(core.images_list))
+        job.stats = stats_snapshot()
+        job.stage = 'done'
+        logging.info(f"job {job.id} done: {job.images} images, {job.groups} groups")
+
+
+    def status(self, id: int = None):
+        with self.lock:
+            if id is None:
+                return [job.status() for job in self.jobs.values()]
+            job = self.jobs.get(id)
+        return job.status() if job else None
+
+
+def warm_decoders():
+    # import optional decoders so the first job does not pay for them
+    for module in ('cv2', 'numpy', 'exifread', 'rawpy', 'pillow_heif', 'PIL.Image'):
+        try:
+            __import__(module)
+        except ImportError:
+            logging.debug(f"decoder not available: {module}")
+
+
+def serve(service: RankingService, host: str = '127.0.0.1', port: int = 8765) -> ThreadingHTTPServer:
+    """
+    Create HTTP server for the service
+    POST /jobs {"directory": ..., "priority": 0, ...options} -> job status
+    GET  /jobs -> all job status
+    GET  /jobs/<id> -> job status
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def reply(self, code: int, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            parts = self.path.strip('/').split('/')
+            if parts == ['jobs']:
+                return self.reply(200, service.status())
+            if len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit():
+                status = service.status(int(parts[1]))
+                if status:
+                    return self.reply(200, status)
+            self.reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path.strip('/') != 'jobs':
+                return self.reply(404, {'error': 'not found'})
+            try:
+                options = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                job = service.submit(options, int(options.pop('priority', 0)))
+                self.reply(200, job.status())
+            except (ValueError, TypeError) as e:
+                self.reply(400, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            logging.debug(f"service: {format % args}")
+
+    return ThreadingHTTPServer((host, port), Handler)
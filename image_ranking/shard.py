@@ -0,0 +1,248 @@
+import os
+import copy
+import pickle
+import logging
+import argparse
+
+from concurrent.futures import ProcessPoolExecutor
+
+from image_ranking.core import Core
+from image_ranking.image_group import ImageGrouper
+from image_ranking.get_and_hash_images import get_images, hash_images
+from image_ranking.stats import stats_add, stats_reset, stats_snapshot
+
+
+# classes a shard result may contain, shard files are loaded with a restricted unpickler
+SHARD_CLASSES = {
+    ('argparse', 'Namespace'),
+    ('image_ranking.image_hash', 'ImageHash'),
+    ('numpy', 'ndarray'),
+    ('numpy', 'dtype'),
+    ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy._core.multiarray', 'scalar'),
+    ('numpy.core.multiarray', '_reconstruct'),
+    ('numpy.core.multiarray', 'scalar'),
+    ('exifread.core.ifd_tag', 'IfdTag'),
+    ('exifread.tags.fields', 'FieldType'),
+    ('exifread.classes', 'IfdTag'),
+    ('exifread.utils', 'Ratio'),
+    ('fractions', 'Fraction'),
+    ('builtins', 'set'),
+    ('builtins', 'frozenset'),
+}
+
+
+class ShardUnpickler(pickle.Unpickler):
+
+    """
+    Unpickler that only resolves the classes of shard results, a shard file
+    referencing any other callable is rejected instead of executed
+    """
+    def find_class(self, module: str, name: str):
+        if (module, name) not in SHARD_CLASSES:
+            raise pickle.UnpicklingError(f"shard file references {module}.{name}, not a shard result")
+        return super().find_class(module, name)
+
+
+def split_shards(array: list, count: int) -> list:
+    """
+    Split list into contiguous shards of near equal size
+    :param array: items in capture order
+    :param count: number of shards
+    :return: a list of shards, empty if there are less items than shards
+    """
+    count = max(1, count)
+    size, extra = divmod(len(array), count)
+    shards = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(array[start:end])
+        start = end
+    return shards
+
+
+def get_shard_images(args: argparse.Namespace, index: int) -> list:
+    # list and validate images, every node splits the same sorted list
+    return split_shards(get_images(args), args.shards)[index]
+
+
+def run_shard(args: argparse.Namespace, images: list) -> tuple:
+    """
+    Process a single shard, hash, group and calculate blur
+    :param args: arguments namespace
+    :param images: a list of tuple(image, file_part)
+    :return: tuple(images, group state, stats)
+    """
+    stats_reset()
+
+    # decode memory budget of this worker process
+    if args.max_decode_memory > 0:
+        from image_ranking.decode_memory import set_decode_memory
+        set_decode_memory(args.max_decode_memory)
+
+    core = Core(args)
+    core.images_list = hash_images(images, args)
+    core.group()
+
+    # progressive scores depend on the whole group, merged boundary groups are scored on merge
+    if args.blur_tolerance <= 0:
+        core.calculate_blur()
+
+    return core.images_list, core.group_state, stats_snapshot()
+
+
+def run_shard_profiled(args: argparse.Namespace, images: list, interval: float) -> tuple:
+    """
+    Process a single shard with a profiler of the worker process
+    :param interval: sampling interval in seconds
+    :return: tuple(shard result, stage name -> StageSamples)
+    """
+    from image_ranking.profiler import StageProfiler
+    profiler = StageProfiler(interval)
+    try:
+        with profiler.stage("run_shard"):
+            result = run_shard(args, images)
+    finally:
+        profiler.stop()
+    return result, profiler.stages
+
+
+def get_shard_path(args: argparse.Namespace, index: int) -> str:
+    return os.path.join(args.shard_dir, f"shard-{index:04d}.pkl")
+
+
+def get_shard_fingerprint(args: argparse.Namespace, index: int, images: list) -> dict:
+    # options and files a shard result depends on, a merge only accepts shards of the same run
+    from image_ranking.journal import get_journal_options
+    return {
+        'options': get_journal_options(args),
+        'shards': args.shards,
+        'index': index,
+        'files': [item[0].filename for item in images],
+    }
+
+
+def write_shard(args: argparse.Namespace, index: int, images: list, result: tuple):
+    # write to temp file first so readers never see a partial shard
+    path = get_shard_path(args, index)
+    os.makedirs(args.shard_dir, exist_ok=True)
+    with open(f"{path}.tmp", 'wb') as f:
+        pickle.dump((get_shard_fingerprint(args, index, images), result), f)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_shard(args: argparse.Namespace, index: int, images: list) -> tuple | None:
+    """
+    Read a shard result written by another node
+    :param images: a list of tuple(image, file_part), the files of this shard
+    :return: shard result, None if the shard was written with other options or files
+    """
+    # shard dirs are shared between nodes, only shard result classes are loaded
+    with open(get_shard_path(args, index), 'rb') as f:
+        fingerprint, result = ShardUnpickler(f).load()
+    if fingerprint != get_shard_fingerprint(args, index, images):
+        logging.error(f"shard {index} in {args.shard_dir} was written with different options or files")
+        return None
+    return result
+
+
+def merge_shards(results: list) -> list:
+    """
+    Merge shard results, re-groups the start of each shard with the grouping
+    state of the previous shard until it converges with the in-shard groups
+    :param results: a list of tuple(images, group state, stats) in shard order
+    :return: merged images
+    """
+    images_list = []
+    state = None
+
+    for images, shard_state, shard_stats in results:
+
+        # merge worker statistics
+        for name, value in shard_stats.items():
+            if isinstance(value, (int, float)):
+                stats_add(name, value)
+
+        # continue grouping from the previous shard
+        converged = state is None
+        if not converged:
+            grouper = ImageGrouper(*state)
+            for image in images:
+                shard_root = image.root
+                image.root = None
+                stats_add("shard_boundary_images")
+
+                # converged, image starts a group in both runs
+                if grouper.add(image) and shard_root is None:
+                    converged = True
+                    break
+
+        # keep in-shard state once converged
+        state = shard_state if converged else grouper.state
+        images_list.extend(images)
+
+    return images_list
+
+
+def merge_blur(core: Core):
+    # lazy blur skipped shard singletons, merged boundary groups can need them
+    if core.args.lazy_blur or core.args.blur_tolerance > 0:
+        core.calculate_blur()
+
+
+def run_sharded(args: argparse.Namespace, profiler=None) -> Core:
+    """
+    Process images in time contiguous shards on worker processes and merge
+    :param args: arguments namespace
+    :param profiler: stage profiler, worker processes are sampled and merged into it
+    :return: core with merged images, ready for ratings
+    """
+    core = Core(args)
+
+    # only merge results written by other nodes
+    if args.merge_shards:
+        logging.info(f"merge shards from {args.shard_dir}")
+        shards = split_shards(get_images(args), args.shards)
+        results = [read_shard(args, i, images) for i, images in enumerate(shards)]
+        if None in results:
+            logging.error("shards do not match this run, ratings are not applied")
+            return core
+        core.images_list = merge_shards(results)
+        merge_blur(core)
+        return core
+
+    # process a single shard and save it for merging
+    if args.shard_index is not None:
+        logging.info(f"shard {args.shard_index + 1}/{args.shards}")
+        images = get_shard_images(args, args.shard_index)
+        write_shard(args, args.shard_index, images, run_shard(args, images))
+        return core
+
+    # split threads between worker processes
+    shards = [shard for shard in split_shards(get_images(args), args.shards) if shard]
+    if len(shards) == 0:
+        return core
+    worker_args = copy.copy(args)
+    worker_args.threads = max(1, args.threads // len(shards))
+    worker_args.max_decode_memory = args.max_decode_memory // len(shards)
+
+    # process shards in parallel
+    logging.info(f"process {len(shards)} shards")
+    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        if profiler is None:
+            results = list(executor.map(run_shard, [worker_args] * len(shards), shards))
+
+        # the main process only waits, sample the workers
+        else:
+            results = []
+            profiled = executor.map(run_shard_profiled, [worker_args] * len(shards), shards,
+                                    [profiler.interval] * len(shards))
+            for i, (result, stages) in enumerate(profiled):
+                profiler.merge(stages, f"shard-{i}")
+                results.append(result)
+
+    # merge shard groups
+    core.images_list = merge_shards(results)
+    merge_blur(core)
+    return core
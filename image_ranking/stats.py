@@ -0,0 +1,48 @@
+import logging
+import threading
+
+# run statistics, shared across worker threads
+_lock = threading.Lock()
+_counters = {}
+
+
+def stats_add(name: str, value: float = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def stats_set(name: str, value):
+    with _lock:
+        _counters[name] = value
+
+
+def stats_get(name: str, default=0):
+    with _lock:
+        return _counters.get(name, default)
+
+
+def stats_snapshot() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+def stats_reset():
+    with _lock:
+        _counters.clear()
+
+
+def stats_log():
+
+    # nothing recorded
+    counters = stats_snapshot()
+    if not counters:
+        return
+
+    # log sorted counters
+    message = "stats:"
+    for name in sorted(counters):
+        value = counters[name]
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        message += f"\n  {name}: {value}"
+    logging.info(message)